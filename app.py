@@ -1,28 +1,50 @@
 
 import streamlit as st
 import cv2
-import numpy as np
 import time
 import os
-from src.camera import Camera
-from src.pose_detection import PoseDetector
+from src.frame_source import open_source
+from src.pose_detection import SharedPoseDetector
 from src.pose_matching import PoseMatcher
+from src.duo_matching import DuoMatcher
 from src.audio import AudioManager
-from src.video_recorder import VideoRecorder
+from src.video_recorder import VideoRecorder, DROP_OLDEST
+from src.inference_worker import AsyncPoseInference
+from src.iconic_cache import IconicImageCache
+from src.streaming_match import StreamingMatcher
+from src.tracker import PoseTracker
+from src.detection_scheduler import DetectionScheduler
+from src.metrics import LoopMetrics
+from src.display_sink import DisplaySink
+from src.frame_pool import frame_pool, FrameRing, constant_frame, text_frame
 
 st.set_page_config(page_title="TwinBros Pose Matching", layout="wide")
 
 # Cached Resources to prevent reloading/locking on rerun
 @st.cache_resource
-def get_camera():
-    return Camera()
+def get_camera(source="0", realtime=True):
+    # Cameras use threaded capture: get_frame() always returns the newest frame immediately.
+    # Video files / image folders replay recorded footage (looped) on machines without a webcam.
+    return open_source(source, realtime=realtime, loop=True)
 
+@st.cache_resource
 def get_detector():
-    return PoseDetector()
+    # Fused + warmed once and guarded by a lock, so every rerun and browser
+    # session can share it (this used to raise 'AttributeError: bn').
+    return SharedPoseDetector()
+
+@st.cache_resource
+def get_matcher(scoring="procrustes"):
+    # Procrustes: a lean or a mirrored pose still matches its reference
+    return PoseMatcher(scoring=scoring)
 
 @st.cache_resource
-def get_matcher():
-    return PoseMatcher()
+def get_duo_matcher(scoring="procrustes"):
+    return DuoMatcher(get_matcher(scoring))
+
+@st.cache_resource
+def get_iconic_cache(image_dir):
+    return IconicImageCache(image_dir)
 
 @st.cache_resource
 def get_audio_manager(sound_dir):
@@ -51,17 +73,36 @@ def main():
     pose_interval = st.sidebar.slider("Pose Interval (s)", 1, 10, 3)
     
     run_camera = st.sidebar.checkbox("Run Camera", value=False)
+    video_source = st.sidebar.text_input("Video Source", "0", help="Camera index, video file or image folder")
+    # Off: file sources play as fast as the loop runs (for measuring throughput)
+    realtime_playback = st.sidebar.checkbox("Real-time Playback", value=True)
+    # Pipeline mode: YOLO runs in a worker thread so the preview keeps camera rate
+    async_inference = st.sidebar.checkbox("Async Inference", value=True)
+    pose_scoring = st.sidebar.selectbox("Pose Scoring", ["procrustes", "cosine"])
+    # Detect only around tracked people, with a full-frame pass now and then for newcomers
+    roi_redetection = st.sidebar.checkbox("ROI Re-detection", value=False)
+    # Detection rate and input size follow the session phase (full rate only right before capture)
+    adaptive_detection = st.sidebar.checkbox("Adaptive Detection", value=True)
+    # Per-stage latency (capture, inference, match, draw, record, display) and FPS
+    metrics_overlay = st.sidebar.checkbox("Metrics Overlay", value=False)
+    export_metrics = st.sidebar.checkbox("Export Metrics", value=False,
+                                         help="output/metrics.jsonl + output/twinbros.prom every 10 s")
+    # Preview transport: JPEG at a capped rate, independent of capture/inference (recording gets every frame)
+    display_quality = st.sidebar.slider("Display Quality (JPEG)", 30, 95, 80)
+    display_fps = st.sidebar.slider("Display FPS", 5, 30, 15)
     
     if st.sidebar.button("Reset Cache (Fix Camera)"):
         st.cache_resource.clear()
         st.rerun()
 
     # Placeholders for UI
-    col1, col2 = st.columns(2)
+    col1, col2, col3 = st.columns(3)
     with col1:
         time_metric = st.empty()
     with col2:
         next_pose_metric = st.empty()
+    with col3:
+        hint_metric = st.empty()
         
     video_placeholder = st.empty()
     status_placeholder = st.empty()
@@ -75,6 +116,8 @@ def main():
         st.session_state.next_capture_time = 0
     if "match_display_until" not in st.session_state:
         st.session_state.match_display_until = 0
+    if "flash_until" not in st.session_state:
+        st.session_state.flash_until = 0
     if "last_match_image" not in st.session_state:
         st.session_state.last_match_image = None
     if "final_video_path" not in st.session_state:
@@ -84,16 +127,17 @@ def main():
     # We will instantiate it locally. If session interrupts, we might lose close. 
     # But usually VideoRecorder creates a new file on .start().
     output_dir = os.path.join(base_dir, "output")
-    video_recorder = VideoRecorder(output_dir)
+    # Async: frames are encoded on a background thread, never on the render loop
+    video_recorder = VideoRecorder(output_dir, async_mode=True, full_policy=DROP_OLDEST)
 
     # Helper objects
     if run_camera:
         # Load resources (cached where appropriate)
         try:
-            cam = get_camera()
-            # Detector is NOT cached to avoid 'AttributeError: bn'
+            cam = get_camera(video_source.strip() or "0", realtime_playback)
             detector = get_detector()
-            matcher = get_matcher()
+            st.sidebar.caption(f"Pose model: load {detector.load_time:.2f}s, warm-up {detector.warmup_time:.2f}s")
+            duo_matcher = get_duo_matcher(pose_scoring)
             # Audio Manager depends on sound_dir.
             audio_manager = get_audio_manager(sound_dir)
         except Exception as e:
@@ -110,6 +154,8 @@ def main():
                 pass
         
         iconic_img_dir = os.path.join(base_dir, "data", "iconic_images")
+        iconic_cache = get_iconic_cache(iconic_img_dir)
+        prefetched_for = None
 
         # Start Button
         if not st.session_state.session_active:
@@ -149,21 +195,91 @@ def main():
         # The user won't get a video for the full session if they interrupted it.
         # That is acceptable for V1.
         
+        inference = AsyncPoseInference(detector) if async_inference else None
+        seq = 0
+        # Matches every new inference result, so the capture result is always ready
+        streaming = StreamingMatcher(duo_matcher)
+        streamed_seq = None
+        # Stable person IDs, so per-person scores survive YOLO reordering people
+        tracker = PoseTracker()
+        FULL_FRAME_EVERY = 15
+        scheduler = DetectionScheduler() if adaptive_detection else None
+        detections = 0
+        keypoints_seq, keypoints = 0, None
+        metrics = LoopMetrics(jsonl_path=os.path.join(output_dir, "metrics.jsonl") if export_metrics else None,
+                              prom_path=os.path.join(output_dir, "twinbros.prom") if export_metrics else None)
+        displays = FrameRing()  # display copies, sent and recorded before the buffer comes round again
+        frame = None
+        display_sink = DisplaySink(lambda data: video_placeholder.image(data, output_format="JPEG"),
+                                   quality=display_quality, max_fps=display_fps)
+
         try:
             while run_camera:
-                frame = cam.get_frame()
+                # Waits for the next camera frame, which also paces the loop
+                previous = frame
+                # Waiting for the camera is idle time, not capture cost: that is timed on the capture side
+                with metrics.stage("wait"):
+                    seq, timestamp, frame = cam.read(newer_than=seq)
+                # Done with the previous camera frame (the inference worker retains its own)
+                frame_pool.release(previous)
                 if frame is None:
                     st.error("Failed to capture frame.")
                     break
+                metrics.count("capture")
+                metrics.record("capture", cam.last_read_time)
+                metrics.record("frame_age", time.monotonic() - timestamp)
                 
+                # Skipped frames keep the previous keypoints
+                imgsz = None
+                run_detection = True
+                if scheduler is not None:
+                    imgsz = scheduler.plan(st.session_state.session_active,
+                                           st.session_state.next_capture_time,
+                                           st.session_state.match_display_until)
+                    run_detection = imgsz is not None
+
                 # Detect poses separately
-                keypoints = detector.get_keypoints(frame)
+                if run_detection:
+                    roi = None
+                    if roi_redetection and detections % FULL_FRAME_EVERY != 0:
+                        roi = tracker.roi(frame.shape)
+                    detections += 1
+                    if inference is not None:
+                        # `frame` itself is never drawn on, the worker reads it
+                        inference.submit(seq, frame, roi, imgsz)
+                    else:
+                        with metrics.stage("inference"):
+                            keypoints = detector.get_keypoints(frame, roi, imgsz)
+                        keypoints_seq = seq
+                if inference is not None:
+                    # Draw the newest finished result
+                    keypoints_seq, keypoints = inference.latest()
+
+                # Smoothed match scores, updated once per inference result
+                if keypoints_seq != streamed_seq:
+                    streamed_seq = keypoints_seq
+                    metrics.count("inference")
+                    if inference is not None:
+                        # Timed on the worker thread
+                        metrics.record("inference", inference.last_latency)
+                    with metrics.stage("match"):
+                        track_ids = tracker.update(keypoints)
+                        streaming.update(*detector.normalize_people(keypoints), track_ids=track_ids)
+                    closest = streaming.best()
+                    if closest is not None:
+                        hint_metric.metric("Closest Duo", closest[0], f"{closest[1]:.2f}", delta_color="off")
+                    else:
+                        hint_metric.metric("Closest Duo", "-")
 
                 current_time = time.time()
-                display_frame = frame.copy()
+                draw_start = time.perf_counter()
+                display_frame = displays.copy(frame)  # reused buffer, no per-frame allocation
+                # Decided once: the session logic below may end the session and swap display_frame
+                # for a read-only flash or the stored match image, which must not be drawn on
+                standby = not st.session_state.session_active
 
                 # Session Logic
-                if st.session_state.session_active:
+                if not standby:
                     # If we just reran and lost the recorder, we should probably warn or try to restart (new file)?
                     # `video_recorder` here is new. `is_recording` is False.
                     if not video_recorder.is_recording:
@@ -188,9 +304,9 @@ def main():
                         if selected_music != "None":
                             audio_path = os.path.join(sound_dir, selected_music)
                             
-                        st.info("Processing video with audio...")
-                        video_recorder.stop(audio_path=audio_path)
-                        st.success(f"Session Finished!")
+                        # Remaining frames and the audio merge finish on the encoder thread
+                        video_recorder.stop(audio_path=audio_path, wait=False)
+                        st.success(f"Session Finished! Finalizing video in the background...")
                         if st.session_state.final_video_path:
                              status_placeholder.info(f"Video saved to: {st.session_state.final_video_path}")
                         st.balloons()
@@ -201,9 +317,16 @@ def main():
                     # REMOVED: cv2.putText(display_frame, f"Time: {int(remaining)}s", (20, 50), cv2.FONT_HERSHEY_DUPLEX, 1, (0, 255, 255), 2)
                     time_metric.metric("Session Time Left", f"{int(remaining)}s")
 
-                    if current_time < st.session_state.match_display_until:
-                        if st.session_state.last_match_image is not None:
-                            match_img = cv2.resize(st.session_state.last_match_image, (display_frame.shape[1], display_frame.shape[0]))
+                    if current_time < st.session_state.flash_until:
+                        # Flash window: white frames for a moment, the loop keeps running (cached, read-only)
+                        display_frame = constant_frame(frame.shape, 255)
+                    elif current_time < st.session_state.match_display_until:
+                        match_img = st.session_state.last_match_image
+                        if match_img is not None:
+                            # Already frame-sized when the match was made; no per-frame resize
+                            if match_img.shape != display_frame.shape:
+                                match_img = cv2.resize(match_img, (display_frame.shape[1], display_frame.shape[0]))
+                                st.session_state.last_match_image = match_img
                             display_frame = match_img
                     else:
                         time_to_capture = st.session_state.next_capture_time - current_time
@@ -212,40 +335,40 @@ def main():
                              next_pose_metric.metric("Next Pose In", f"{int(time_to_capture)+1}s")
                         else:
                              next_pose_metric.metric("Next Pose In", "NOW!")
+
+                        # Last second before capture: warm the image cache with the current top-k
+                        if time_to_capture <= 1.0 and prefetched_for != st.session_state.next_capture_time and streaming.top():
+                            prefetched_for = st.session_state.next_capture_time
+                            candidates = [duo for duo, _, _ in streaming.top(5)]
+                            iconic_cache.prefetch(candidates, (frame.shape[1], frame.shape[0]))
                         
                         if current_time >= st.session_state.next_capture_time:
-                            # Flash Effect
-                            flash_frame = 255 * np.ones_like(frame, dtype=np.uint8)
-                            if st.session_state.session_active and video_recorder.is_recording:
-                                video_recorder.write(flash_frame)
-                            video_placeholder.image(flash_frame, channels="BGR")
-                            time.sleep(0.2)
+                            # Smoothed over the last frames, so a blink at this instant does not decide it
+                            best = streaming.best()
+
+                            # Flash Effect: shown by the loop itself during the flash window
+                            st.session_state.flash_until = current_time + 0.2
+                            display_frame = constant_frame(frame.shape, 255)
                             
-                            if keypoints and len(keypoints) > 0:
-                                person = keypoints[0]
-                                coords = np.array(person)[:, :2]
-                                norm_pose = detector.normalize_pose(coords)
-                                best_name, best_score = matcher.match(norm_pose)
+                            if best is not None:
+                                # Everyone in frame is matched against both people of every duo
+                                base_name, best_score, _ = best
                                 
-                                base_name = best_name.split("_person")[0]
-                                image_path = None
-                                for f in os.listdir(iconic_img_dir):
-                                    if f.startswith(base_name):
-                                        image_path = os.path.join(iconic_img_dir, f)
-                                        break
+                                # Decoded and resized to the camera frame size, usually already cached
+                                match_img = iconic_cache.get(base_name, (frame.shape[1], frame.shape[0]))
                                 
-                                if image_path and os.path.exists(image_path):
-                                    img_overlay = cv2.imread(image_path)
-                                    # Fix: Resize to match camera frame size
-                                    img_overlay = cv2.resize(img_overlay, (frame.shape[1], frame.shape[0]))
+                                # Kept on screen for 2 s, so a plain copy rather than a pooled buffer
+                                if match_img is not None:
+                                    img_overlay = match_img.copy()
                                 else:
-                                    img_overlay = np.zeros_like(frame)
-                                    cv2.putText(img_overlay, "Image Not Found", (50, 240), cv2.FONT_HERSHEY_DUPLEX, 1, (0,0,255), 2)
+                                    img_overlay = text_frame(
+                                        frame.shape, [("Image Not Found", (50, 240), 1, (0, 0, 255), 2)]).copy()
                                 
                                 cv2.putText(img_overlay, f"{base_name} ({best_score:.2f})", (20, 50), cv2.FONT_HERSHEY_DUPLEX, 1, (255, 255, 255), 2)
                                 st.session_state.last_match_image = img_overlay
-                                st.session_state.match_display_until = current_time + 2
-                                display_frame = img_overlay
+                                st.session_state.match_display_until = st.session_state.flash_until + 2
+                                # Start the next pose from scratch
+                                streaming.reset()
                             else:
                                 st.toast("No Pose Detected!")
                             
@@ -254,26 +377,37 @@ def main():
                 else:
                     cv2.putText(display_frame, "Press Start Session", (20, 460), cv2.FONT_HERSHEY_DUPLEX, 0.8, (255, 255, 255), 1)
 
-                # Draw Keypoints (only in Standby mode)
-                if not st.session_state.session_active:
+                # Draw Keypoints (only in Standby mode, on the camera copy)
+                if standby:
                     if keypoints is not None:
-                         for person in keypoints:
-                            for (x, y, conf) in person:
-                                if conf > 0.5:
-                                    cv2.circle(display_frame, (int(x), int(y)), 3, (0, 255, 0), -1)
+                        keypoints.draw(display_frame)
+
+                metrics.record("draw", time.perf_counter() - draw_start)
 
                 # Record
                 if st.session_state.session_active and video_recorder.is_recording:
-                    video_recorder.write(display_frame)
+                    with metrics.stage("record"):
+                        video_recorder.write(display_frame)
 
-                display_frame_rgb = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
-                video_placeholder.image(display_frame_rgb, channels="RGB")
-                time.sleep(0.01) # Slightly faster loop
+                # Frames between display slots are only recorded, not sent to the browser
+                if display_sink.due():
+                    if metrics_overlay:
+                        # After recording, so the numbers never end up in the video
+                        display_frame = metrics.draw(displays.copy(display_frame))
+                    with metrics.stage("display"):
+                        display_sink.show(display_frame)
+                    metrics.count("render")
+                metrics.maybe_export()
         
         finally:
             # Cleanup if break
+            if inference is not None:
+                inference.stop()
+            metrics.flush()
+            # The cached camera keeps running; hand back the frame this loop held
+            frame_pool.release(frame)
             if video_recorder.is_recording:
-                video_recorder.stop()
+                video_recorder.stop(wait=False)
             # Note: We do NOT release cam here because we want to reuse it!
             # But if the user unchecked "Run Camera", we loop exits. 
             pass
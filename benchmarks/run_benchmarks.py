@@ -0,0 +1,291 @@
+"""
+Offline benchmarks for the booth hot path: detection, normalization, matching and recording.
+
+Runs on recorded frames (or data/iconic_images) and the reference library,
+writes a JSON file with one entry per benchmark, and compares it with a
+saved baseline so a slowdown is caught before it reaches a booth:
+
+    python benchmarks/run_benchmarks.py --save-baseline          # once, on the booth PC
+    python benchmarks/run_benchmarks.py                          # later: exits 1 on regression
+    python benchmarks/run_benchmarks.py --only matcher --quick
+"""
+import os
+import sys
+import json
+import time
+import wave
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "src"))
+
+from pose_store import DEFAULT_STORE_PATH, NUM_KEYPOINTS, load_library, normalize_keypoints, save_library
+from pose_matching import PoseMatcher
+from video_recorder import VideoRecorder, BLOCK
+from frame_source import open_source
+from pose_batch import PoseBatch
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, "results.json")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+SUITES = ("detector", "normalize", "matcher", "recorder")
+LIBRARY_SIZES = (100, 10_000, 100_000)
+DETECTOR_SIZES = (320, 416, 640)
+
+
+def timed(fn, repeat, warmup=3):
+    """Call fn repeat times (after warmup calls) and return per-call latency stats in ms."""
+    for _ in range(warmup):
+        fn()
+    times = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times[i] = time.perf_counter() - start
+    times *= 1000
+    return {"value": float(np.median(times)), "unit": "ms", "better": "lower", "n": repeat,
+            "mean_ms": float(times.mean()), "p50_ms": float(np.median(times)),
+            "p95_ms": float(np.percentile(times, 95)), "min_ms": float(times.min())}
+
+
+def throughput(frames, seconds):
+    return {"value": frames / seconds, "unit": "fps", "better": "higher", "n": frames, "seconds": seconds}
+
+
+def load_frames(spec, limit):
+    source = open_source(spec, realtime=False)
+    frames = []
+    try:
+        while len(frames) < limit:
+            frame = source.get_frame()
+            if frame is None:
+                break
+            frames.append(frame)
+    finally:
+        source.release()
+    if not frames:
+        raise RuntimeError(f"No frames in {spec}")
+    return frames
+
+
+def sample_keypoints(n, seed=0):
+    """Pixel-space keypoints (n, 17, 3) built from the reference library, with jitter and a few hidden joints."""
+    rng = np.random.default_rng(seed)
+    array, _ = load_library(DEFAULT_STORE_PATH, mmap=False)
+    base = array[rng.integers(0, len(array), n)]
+    kps = np.zeros((n, NUM_KEYPOINTS, 3), dtype=np.float32)
+    kps[:, :, :2] = base[:, :, :2] * 400 + 320 + rng.normal(0, 3, (n, NUM_KEYPOINTS, 2))
+    kps[:, :, 2] = np.where(rng.random((n, NUM_KEYPOINTS)) < 0.9, 0.9, 0.1) * base[:, :, 2]
+    return kps
+
+
+def synthetic_library(size, work_dir, seed=0):
+    """Store path of a library with `size` poses (jittered copies of the real references, in duos)."""
+    store = os.path.join(work_dir, f"synthetic_{size}")
+    if os.path.exists(store + ".npy"):
+        return store
+    rng = np.random.default_rng(seed)
+    array, _ = load_library(DEFAULT_STORE_PATH, mmap=False)
+    picks = rng.integers(0, len(array), size)
+    poses = array[picks, :, :2] + rng.normal(0, 0.02, (size, NUM_KEYPOINTS, 2)).astype(np.float32)
+    entries = [{"name": f"synthetic_{i // 2}_person{i % 2 + 1}", "pose": pose, "mask": array[p, :, 2] > 0}
+               for i, (pose, p) in enumerate(zip(poses, picks))]
+    save_library(store, entries)
+    return store
+
+
+def bench_detector(args, results):
+    try:
+        from pose_detection import PoseDetector
+        detector = PoseDetector(backend=args.backend)
+    except Exception as e:
+        print(f"[WARNING] Detector benchmark skipped: {e}")
+        return
+    frames = load_frames(args.frames, args.frame_count)
+    for imgsz in DETECTOR_SIZES:
+        state = {"i": 0}
+
+        def detect():
+            detector.get_keypoints(frames[state["i"] % len(frames)], imgsz=imgsz)
+            state["i"] += 1
+
+        results[f"detector.get_keypoints.imgsz{imgsz}"] = timed(detect, args.repeat)
+
+    batch = frames[:4] if len(frames) >= 4 else (frames * 4)[:4]
+    results["detector.get_keypoints_batch.4"] = timed(lambda: detector.get_keypoints_batch(batch), args.repeat)
+    kps = sample_keypoints(1)
+    results["detector.normalize_pose"] = timed(lambda: detector.normalize_pose(kps[0, :, :2].copy()),
+                                               args.repeat * 10)
+
+
+def bench_normalize(args, results):
+    kps = sample_keypoints(4)
+    results["normalize.normalize_keypoints"] = timed(
+        lambda: normalize_keypoints(kps[0, :, :2], kps[0, :, 2] > 0.5), args.repeat * 10)
+
+    def normalize_four():
+        for person in kps:
+            normalize_keypoints(person[:, :2], person[:, 2] > 0.5)
+
+    results["normalize.people4"] = timed(normalize_four, args.repeat * 10)
+    batch = PoseBatch(kps)
+    results["normalize.batch4"] = timed(batch.normalize, args.repeat * 10)
+
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    results["draw.batch4"] = timed(lambda: batch.draw(frame), args.repeat * 10)
+
+
+def bench_matcher(args, results, work_dir):
+    kps = sample_keypoints(64, seed=1)
+    queries = [normalize_keypoints(k[:, :2], k[:, 2] > 0.5) for k in kps]
+    sizes = [s for s in LIBRARY_SIZES if not (args.quick and s > 10_000)]
+    for size in sizes:
+        store = synthetic_library(size, work_dir)
+        for scoring in ("cosine", "procrustes"):
+            matcher = PoseMatcher(store_path=store, scoring=scoring, use_index=False)
+            state = {"i": 0}
+
+            def match():
+                pose, mask = queries[state["i"] % len(queries)]
+                matcher.match(pose, mask)
+                state["i"] += 1
+
+            results[f"matcher.match.{scoring}.{size}"] = timed(match, args.repeat)
+
+        # Floor for cosine scoring: one plain matrix-vector product over the library
+        q = queries[0][0].reshape(-1)
+        results[f"matcher.plain_dot.{size}"] = timed(lambda: matcher.coords @ q, args.repeat)
+
+
+def write_tone(path, seconds, rate=44100):
+    t = np.arange(int(seconds * rate)) / rate
+    samples = (np.sin(2 * np.pi * 440 * t) * 0.2 * 32767).astype(np.int16)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(samples.tobytes())
+
+
+def bench_recorder(args, results, work_dir):
+    frames = load_frames(args.frames, args.frame_count)
+    frames = [np.ascontiguousarray(f[:480, :640]) for f in frames]
+    h, w = frames[0].shape[:2]
+    frames = [f for f in frames if f.shape[:2] == (h, w)]
+    count = args.record_frames
+
+    for mode, async_mode in (("sync", False), ("async", True)):
+        recorder = VideoRecorder(os.path.join(work_dir, f"rec_{mode}"), async_mode=async_mode, full_policy=BLOCK)
+        recorder.start(w, h)
+        start = time.perf_counter()
+        for i in range(count):
+            recorder.write(frames[i % len(frames)])
+        caller = time.perf_counter() - start
+        recorder.stop()
+        total = time.perf_counter() - start
+        # What the render loop sees vs. what the encoder sustains
+        results[f"recorder.write.{mode}"] = throughput(count, caller)
+        results[f"recorder.encode.{mode}"] = throughput(count, total)
+
+    audio = os.path.join(work_dir, "tone.wav")
+    write_tone(audio, count / 20.0 + 1)
+    recorder = VideoRecorder(os.path.join(work_dir, "rec_mux"))
+    recorder.start(w, h)
+    for i in range(count):
+        recorder.write(frames[i % len(frames)])
+    start = time.perf_counter()
+    recorder.stop(audio_path=audio)
+    results["recorder.finalize_mux"] = {"value": (time.perf_counter() - start) * 1000, "unit": "ms",
+                                        "better": "lower", "n": 1}
+
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                                text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "commit": commit, "python": platform.python_version(),
+            "numpy": np.__version__, "platform": platform.platform(), "cpus": os.cpu_count()}
+
+
+def compare(results, baseline, threshold):
+    """Print a comparison table and return the names that got slower than threshold allows."""
+    regressions = []
+    print(f"\n{'benchmark':<42} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<42} {'-':>12} {result['value']:>9.2f} {result['unit']:<3}")
+            continue
+        change = result["value"] / base["value"] - 1 if base["value"] else 0.0
+        worse = change > threshold if result["better"] == "lower" else change < -threshold / (1 + threshold)
+        flag = "  REGRESSION" if worse else ""
+        print(f"{name:<42} {base['value']:>9.2f} {base['unit']:<3}{result['value']:>9.2f} {result['unit']:<3}"
+              f"{change * 100:>+7.1f}%{flag}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TwinBros offline benchmarks.")
+    parser.add_argument("--only", nargs="+", choices=SUITES, default=list(SUITES))
+    parser.add_argument("--frames", default=os.path.join(BASE_DIR, "data", "iconic_images"),
+                        help="Recorded frames: video file or image directory")
+    parser.add_argument("--frame-count", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--record-frames", type=int, default=300)
+    parser.add_argument("--backend", default=None, help="Pose backend for the detector benchmark")
+    parser.add_argument("--quick", action="store_true", help="Fewer repeats, no 100k library")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Also store these results as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed slowdown before failing (0.15 = 15%%)")
+    args = parser.parse_args()
+    if args.quick:
+        args.repeat = max(5, args.repeat // 5)
+        args.record_frames = min(args.record_frames, 100)
+
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix="twinbros_bench_")
+    try:
+        if "normalize" in args.only:
+            bench_normalize(args, results)
+        if "matcher" in args.only:
+            bench_matcher(args, results, work_dir)
+        if "detector" in args.only:
+            bench_detector(args, results)
+        if "recorder" in args.only:
+            bench_recorder(args, results, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {"meta": metadata(), "results": results}
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[INFO] Results saved: {args.output}")
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f)["results"], args.threshold)
+    if args.save_baseline:
+        shutil.copyfile(args.output, args.baseline)
+        print(f"[INFO] Baseline saved: {args.baseline}")
+
+    if regressions:
+        print(f"[ERROR] {len(regressions)} benchmark(s) regressed more than {args.threshold:.0%}: "
+              + ", ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+import os
+import time
+import argparse
+import cv2
+
+try:
+    from .frame_source import open_source
+    from .frame_pool import frame_pool, FrameRing, constant_frame, text_frame
+    from .pose_detection import get_shared_detector
+    from .pose_matching import PoseMatcher
+    from .duo_matching import DuoMatcher
+    from .video_recorder import VideoRecorder, DROP_OLDEST
+    from .iconic_cache import IconicImageCache
+    from .streaming_match import StreamingMatcher
+    from .tracker import PoseTracker
+    from .detection_scheduler import DetectionScheduler
+except ImportError:
+    from frame_source import open_source
+    from frame_pool import frame_pool, FrameRing, constant_frame, text_frame
+    from pose_detection import get_shared_detector
+    from pose_matching import PoseMatcher
+    from duo_matching import DuoMatcher
+    from video_recorder import VideoRecorder, DROP_OLDEST
+    from iconic_cache import IconicImageCache
+    from streaming_match import StreamingMatcher
+    from tracker import PoseTracker
+    from detection_scheduler import DetectionScheduler
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SESSION_DURATION = 15  # seconds
+POSE_INTERVAL = 3      # seconds
+FLASH_TIME = 0.2       # seconds of white frames at a capture
+MATCH_TIME = 2.0       # seconds the match image stays on screen
+IDLE_WAIT = 0.01       # seconds a tick waits for a new frame when no booth has one
+
+
+class Booth:
+    """
+    One booth served by a BoothServer: its camera, session timeline, tracker, smoothed matcher and recorder.
+
+    The booth does no inference itself. The server asks plan() whether the
+    newest frame needs detection, runs one batched predict for all booths,
+    and hands each booth its keypoints through on_keypoints(). render()
+    advances the session (flash, match image, countdown) without blocking,
+    so one slow booth never stalls the others.
+    """
+
+    def __init__(self, booth_id, camera, duo_matcher, recorder, iconic_cache, normalize_people,
+                 adaptive=True, session_duration=SESSION_DURATION, pose_interval=POSE_INTERVAL):
+        self.booth_id = booth_id
+        self.camera = camera
+        self.recorder = recorder
+        self.iconic_cache = iconic_cache
+        self.normalize_people = normalize_people
+        self.session_duration = session_duration
+        self.pose_interval = pose_interval
+
+        self.tracker = PoseTracker()
+        self.streaming = StreamingMatcher(duo_matcher)
+        self.scheduler = DetectionScheduler() if adaptive else None
+        self.displays = FrameRing()
+
+        self.seq = 0
+        self.frame = None
+        self.ended = False          # file source played out (or unthreaded camera failed)
+        self.keypoints = None
+        self.session_active = False
+        self.start_time = 0.0
+        self.next_capture_time = None
+        self.flash_until = 0.0
+        self.match_display_until = 0.0
+        self.match_image = None
+        self.prefetched_for = None
+        self.last_match = None
+
+    @property
+    def name(self):
+        return f"TwinBros - Booth {self.booth_id}"
+
+    def poll(self, timeout=0.0):
+        """Grab the newest camera frame, waiting up to `timeout` for one; return True if it is new."""
+        seq, _, frame = self.camera.read(timeout=timeout, newer_than=self.seq)
+        if frame is None:
+            # A threaded camera just has no frame yet, unless its capture thread stopped; anything else is done
+            self.ended = not self.camera.threaded or self.camera.failed
+            return False
+        if seq == self.seq:
+            # Retained again for this read, but it is the frame we already hold
+            frame_pool.release(frame)
+            return False
+        frame_pool.release(self.frame)
+        self.seq, self.frame = seq, frame
+        return True
+
+    def plan(self, now):
+        """imgsz to detect the current frame with (None = model default), or False to skip it."""
+        if self.scheduler is None:
+            return None
+        imgsz = self.scheduler.plan(self.session_active, self.next_capture_time, self.match_display_until, now)
+        return False if imgsz is None else imgsz
+
+    def on_keypoints(self, keypoints):
+        self.keypoints = keypoints
+        track_ids = self.tracker.update(keypoints)
+        self.streaming.update(*self.normalize_people(keypoints), track_ids=track_ids)
+
+    def start_session(self, now=None):
+        if self.session_active or self.frame is None:
+            return
+        now = time.time() if now is None else now
+        self.session_active = True
+        self.start_time = now
+        self.next_capture_time = now + self.pose_interval
+        self.streaming.reset()
+        self.recorder.start(self.frame.shape[1], self.frame.shape[0])
+        print(f"[INFO] Booth {self.booth_id}: session started")
+
+    def stop_session(self):
+        if not self.session_active:
+            return
+        self.session_active = False
+        self.next_capture_time = None
+        self.recorder.stop(wait=False)
+        print(f"[INFO] Booth {self.booth_id}: session ended")
+
+    def _capture(self, now, frame):
+        best = self.streaming.best()
+        self.flash_until = now + FLASH_TIME
+        self.next_capture_time = now + self.pose_interval + MATCH_TIME
+        self.last_match = best
+        if best is None:
+            print(f"[INFO] Booth {self.booth_id}: no pose detected")
+            return
+        base_name, score, assignment = best
+        print(f"[OK] Booth {self.booth_id}: {base_name} (Score: {score:.2f}, people {assignment})")
+        image = self.iconic_cache.get(base_name, (frame.shape[1], frame.shape[0]))
+        # Kept on screen for MATCH_TIME, so a plain copy rather than a pooled buffer
+        if image is not None:
+            image = image.copy()
+        else:
+            image = text_frame(frame.shape, [("Image Not Found", (50, 240), 1, (0, 0, 255), 2)]).copy()
+        cv2.putText(image, f"{base_name} ({score:.2f})", (20, 50), cv2.FONT_HERSHEY_DUPLEX, 1, (255, 255, 255), 2)
+        self.match_image = image
+        self.match_display_until = self.flash_until + MATCH_TIME
+        self.streaming.reset()
+
+    def render(self, now):
+        """Advance the session and return the frame to show (also recorded during a session)."""
+        frame = self.frame
+        if frame is None:
+            return None
+        display = self.displays.copy(frame)
+
+        if self.session_active and now - self.start_time >= self.session_duration:
+            self.stop_session()
+
+        if not self.session_active:
+            if self.keypoints is not None:
+                self.keypoints.draw(display)
+            cv2.putText(display, f"Booth {self.booth_id}: press '{self.booth_id}' to start", (20, 460),
+                        cv2.FONT_HERSHEY_DUPLEX, 0.8, (255, 255, 255), 1)
+            return display
+
+        if now < self.flash_until:
+            display = constant_frame(frame.shape, 255)
+        elif now < self.match_display_until and self.match_image is not None:
+            display = self.match_image
+        else:
+            time_to_capture = self.next_capture_time - now
+            remaining = int(self.session_duration - (now - self.start_time))
+            cv2.putText(display, f"Session Time: {remaining}s", (20, 50), cv2.FONT_HERSHEY_DUPLEX, 0.8, (255, 255, 255), 2)
+            if time_to_capture > 0:
+                cv2.putText(display, f"Next Pose in: {int(time_to_capture) + 1}", (20, 100),
+                            cv2.FONT_HERSHEY_DUPLEX, 0.8, (255, 255, 255), 2)
+            closest = self.streaming.best()
+            if closest is not None:
+                cv2.putText(display, f"Closest: {closest[0]} ({closest[1]:.2f})", (20, 150),
+                            cv2.FONT_HERSHEY_DUPLEX, 0.6, (255, 255, 255), 2)
+
+            if time_to_capture <= 1.0 and self.prefetched_for != self.next_capture_time and self.streaming.top():
+                self.prefetched_for = self.next_capture_time
+                self.iconic_cache.prefetch([duo for duo, _, _ in self.streaming.top(5)], (frame.shape[1], frame.shape[0]))
+            if time_to_capture <= 0:
+                self._capture(now, frame)
+                display = constant_frame(frame.shape, 255)
+
+        self.recorder.write(display)
+        return display
+
+    def close(self):
+        self.stop_session()
+        self.recorder.join()
+        frame_pool.release(self.frame)
+        self.frame = None
+        self.camera.release()
+
+
+class BoothServer:
+    """
+    Runs several booths on one machine with a single shared pose model.
+
+    Every tick the newest frame of each booth that needs detection goes into
+    one batched predict call (get_keypoints_batch), and the keypoints are
+    routed back to that booth. One model is loaded instead of one per booth,
+    and a batch of B frames costs much less than B batch-size-1 calls, so
+    throughput grows better than linearly with the number of booths. When
+    booths ask for different input sizes (DetectionScheduler), the batch
+    runs at the largest one.
+    """
+
+    def __init__(self, booths, detector):
+        self.booths = booths
+        self.detector = detector
+        self.ticks = 0
+        self.batches = 0
+        self.frames_inferred = 0
+        self.inference_time = 0.0
+        self._wait_index = 0
+
+    def _wait(self):
+        """Block up to IDLE_WAIT on one live booth (round robin) instead of spinning; return the booths with a new frame."""
+        live = [booth for booth in self.booths if not booth.ended]
+        if not live:
+            return []
+        self._wait_index = (self._wait_index + 1) % len(live)
+        booth = live[self._wait_index]
+        return [booth] if booth.poll(IDLE_WAIT) else []
+
+    def tick(self, now=None):
+        """
+        Run one batched detection for all booths with a new frame.
+
+        Returns one display frame per booth, None for booths without a new
+        frame: only those are rendered (and recorded), so recordings get
+        frames at camera rate. When no booth has a new frame the tick
+        waits briefly for one rather than busy-spinning.
+        """
+        fresh = [booth for booth in self.booths if booth.poll()]
+        if not fresh:
+            fresh = self._wait()
+        now = time.time() if now is None else now
+
+        batch, sizes = [], []
+        for booth in fresh:
+            imgsz = booth.plan(now)
+            if imgsz is False:
+                continue
+            batch.append(booth)
+            sizes.append(imgsz)
+
+        if batch:
+            imgsz = None if None in sizes else max(sizes)
+            start = time.perf_counter()
+            results = self.detector.get_keypoints_batch([booth.frame for booth in batch], imgsz)
+            self.inference_time += time.perf_counter() - start
+            self.batches += 1
+            self.frames_inferred += len(batch)
+            for booth, keypoints in zip(batch, results):
+                booth.on_keypoints(keypoints)
+
+        self.ticks += 1
+        return [booth.render(now) if booth in fresh else None for booth in self.booths]
+
+    def stats(self):
+        mean_batch = self.frames_inferred / self.batches if self.batches else 0.0
+        per_frame = self.inference_time / self.frames_inferred * 1000 if self.frames_inferred else 0.0
+        return {"ticks": self.ticks, "batches": self.batches, "frames_inferred": self.frames_inferred,
+                "mean_batch": mean_batch, "ms_per_frame": per_frame}
+
+    def run(self, show=True, auto_start=False):
+        """
+        Tick until 'q', Ctrl+C or the end of all sources; keys '1'..'9' start a session on that booth.
+
+        auto_start starts one session on every booth as soon as it has a
+        frame, so headless runs (no keyboard) capture and match too.
+        """
+        waiting = list(self.booths) if auto_start else []
+        try:
+            while not all(booth.ended for booth in self.booths):
+                displays = self.tick()
+                for booth in [booth for booth in waiting if booth.frame is not None]:
+                    booth.start_session()
+                    waiting.remove(booth)
+                if not show:
+                    continue
+                for booth, display in zip(self.booths, displays):
+                    if display is not None:
+                        cv2.imshow(booth.name, display)
+                key = cv2.waitKey(1) & 0xFF
+                if key == ord('q'):
+                    break
+                for booth in self.booths:
+                    if key == ord(str(booth.booth_id)):
+                        booth.start_session()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for booth in self.booths:
+                booth.close()
+            if show:
+                cv2.destroyAllWindows()
+            stats = self.stats()
+            print(f"[INFO] {stats['frames_inferred']} frames in {stats['batches']} batches "
+                  f"(mean batch {stats['mean_batch']:.1f}, {stats['ms_per_frame']:.1f} ms/frame)")
+
+
+def create_server(sources, adaptive=True, backend=None, realtime=True, loop=False):
+    detector = get_shared_detector(backend=backend)   # one model for every booth
+    duo_matcher = DuoMatcher(PoseMatcher(scoring="procrustes"))
+    iconic_cache = IconicImageCache(os.path.join(BASE_DIR, "data", "iconic_images"))
+
+    booths = []
+    for i, source in enumerate(sources, start=1):
+        camera = open_source(source, realtime, loop)
+        recorder = VideoRecorder(os.path.join(BASE_DIR, "output", f"booth_{i}"),
+                                 async_mode=True, full_policy=DROP_OLDEST)
+        booths.append(Booth(i, camera, duo_matcher, recorder, iconic_cache, detector.normalize_people,
+                            adaptive=adaptive))
+    return BoothServer(booths, detector)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve several TwinBros booths from one process and one model.")
+    parser.add_argument("--sources", nargs="+", default=["0"],
+                        help="One per booth: camera index, video file or image directory")
+    parser.add_argument("--fast", action="store_true", help="Play file sources as fast as possible")
+    parser.add_argument("--loop", action="store_true", help="Restart file sources at the end")
+    parser.add_argument("--backend", default=None, help="ultralytics / onnx / openvino (default TWINBROS_BACKEND)")
+    parser.add_argument("--no-adaptive", action="store_true", help="Detect every frame at the model's size")
+    parser.add_argument("--headless", action="store_true", help="No preview windows")
+    parser.add_argument("--auto-start", action="store_true",
+                        help="Start a session on every booth at its first frame (no keyboard needed)")
+    args = parser.parse_args()
+
+    server = create_server(args.sources, adaptive=not args.no_adaptive, backend=args.backend,
+                           realtime=not args.fast, loop=args.loop)
+    if not args.headless:
+        print("[INFO] Tekan '1'..'9' untuk mulai sesi di booth tersebut, 'q' untuk keluar.")
+    server.run(show=not args.headless, auto_start=args.auto_start)
@@ -1,44 +1,136 @@
 import cv2
+import sys
+import time
+import threading
+from collections import deque
+
+try:
+    from .frame_pool import frame_pool
+except ImportError:
+    from frame_pool import frame_pool
 
 class Camera:
-    def __init__(self, width=720, height=640):
-        self.cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)  # use CAP_DSHOW for Windows
+    def __init__(self, width=720, height=640, threaded=False, buffer_size=2, device=0):
+        # DirectShow opens much faster than MSMF on Windows; elsewhere let OpenCV pick
+        api = cv2.CAP_DSHOW if sys.platform == "win32" else cv2.CAP_ANY
+        self.cap = cv2.VideoCapture(device, api)
         self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
         self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
 
         if not self.cap.isOpened():
-            raise RuntimeError("Camera not detected or already in use")
+            raise RuntimeError(f"Camera {device} not detected or already in use")
 
         self.width = width
         self.height = height
+        self._raw = None  # driver frame buffer, reused by every read (only the reading thread touches it)
+        self.last_read_time = 0.0  # seconds the latest driver read + flip took (capture cost, no waiting)
 
-    def get_frame(self):
-        ret, frame = self.cap.read()
+        # Latest-frame capture: a background thread keeps reading so the driver
+        # buffer never fills up with stale frames while the main loop is busy.
+        self.threaded = threaded
+        self.frames = deque(maxlen=max(1, buffer_size))  # (seq, timestamp, frame)
+        self.seq = 0
+        self._cond = threading.Condition()
+        self._running = False
+        self.failed = False   # capture thread stopped on a failed read (camera unplugged or broken)
+        self._thread = None
+        if threaded:
+            self._running = True
+            self._thread = threading.Thread(target=self._capture_loop, name="CameraCapture", daemon=True)
+            self._thread.start()
+
+    def _read(self):
+        start = time.perf_counter()
+        ret, raw = self.cap.read(self._raw)
         if not ret:
             return None
+        self._raw = raw
 
-        # Flip frame horizontally for mirror effect
-        frame = cv2.flip(frame, 1)
+        # Flip frame horizontally for mirror effect, into a pooled buffer (owned by the caller)
+        frame = cv2.flip(raw, 1, dst=frame_pool.acquire(raw.shape, raw.dtype))
 
+        self.last_read_time = time.perf_counter() - start
         return frame
 
+    def _capture_loop(self):
+        while self._running:
+            frame = self._read()
+            timestamp = time.monotonic()
+            with self._cond:
+                if frame is None:
+                    self._running = False
+                    self.failed = True
+                    print("[ERROR] Camera read failed, capture stopped")
+                else:
+                    self.seq += 1
+                    # The deque owns its frames; one pushed out goes back to the pool
+                    evicted = self.frames[0][2] if len(self.frames) == self.frames.maxlen else None
+                    self.frames.append((self.seq, timestamp, frame))
+                    frame_pool.release(evicted)
+                self._cond.notify_all()
+
+    def read(self, timeout=1.0, newer_than=None):
+        """
+        Return (seq, timestamp, frame) for the newest frame.
+
+        In threaded mode this returns immediately once the first frame has
+        arrived; callers can compare `seq` with the last one they processed to
+        skip or drop frames deliberately. Pass `newer_than=seq` to wait (up to
+        `timeout`) for a frame after that one, which paces a loop at camera
+        rate. Returns (seq, timestamp, None) if no frame is available.
+
+        Frames come from frame_pool and every frame returned is retained
+        for the caller: pass it to frame_pool.release() once done with it
+        (e.g. when reading the next one) so its buffer can be reused. A
+        frame that is never released is just not reused.
+        """
+        if not self.threaded:
+            frame = self._read()
+            if frame is not None:
+                self.seq += 1
+            return self.seq, time.monotonic(), frame
+
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._running and (not self.frames or
+                                     (newer_than is not None and self.frames[-1][0] <= newer_than)):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            if not self.frames or not self._running:
+                return self.seq, time.monotonic(), None
+            seq, timestamp, frame = self.frames[-1]
+            return seq, timestamp, frame_pool.retain(frame)
+
+    def get_frame(self):
+        return self.read()[2]
+
     def release(self):
+        if self._thread is not None:
+            self._running = False
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        with self._cond:
+            for _, _, frame in self.frames:
+                frame_pool.release(frame)
+            self.frames.clear()
         self.cap.release()
 
 # ========== RUN LOOP ==========
 if __name__ == "__main__":
-    cam = Camera()
+    cam = Camera(threaded=True)
     while True:
-        frame, kps = cam.get_frame()
+        frame = cam.get_frame()
         if frame is None:
             print("No frame received, exiting...")
             break
 
         cv2.imshow("YOLOv8 Pose Detection", frame)
+        frame_pool.release(frame)
 
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
 
     cam.release()
     cv2.destroyAllWindows()
-
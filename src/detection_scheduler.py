@@ -0,0 +1,60 @@
+import time
+
+STANDBY = "standby"
+COUNTDOWN = "countdown"
+CAPTURE = "capture"
+SHOWING_MATCH = "showing_match"
+
+# Phase -> (minimum seconds between detections, YOLO imgsz). None = detection off.
+DEFAULT_SETTINGS = {
+    STANDBY: (0.5, 320),        # only keypoint dots are drawn
+    COUNTDOWN: (0.2, 416),      # keeps the live hint and the tracker warm
+    CAPTURE: (0.0, 640),        # last second: every frame, full resolution
+    SHOWING_MATCH: None,        # the match image covers the camera
+}
+
+
+class DetectionScheduler:
+    """
+    Decides per frame whether to run pose detection, and at which input size, from the session phase.
+
+    A match is only needed at next_capture_time, so standby and the early
+    countdown run at a low rate and low resolution, the last
+    `capture_window` seconds run at full rate and full resolution, and
+    detection is off while a match image is on screen.
+    """
+
+    def __init__(self, settings=None, capture_window=1.0):
+        self.settings = dict(DEFAULT_SETTINGS)
+        if settings:
+            self.settings.update(settings)
+        self.capture_window = capture_window
+        self._last_run = 0.0
+        self.runs = {phase: 0 for phase in self.settings}
+        self.skips = {phase: 0 for phase in self.settings}
+
+    def phase(self, now, session_active, next_capture_time=None, showing_until=0.0):
+        if not session_active:
+            return STANDBY
+        if now < showing_until:
+            return SHOWING_MATCH
+        if next_capture_time is not None and next_capture_time - now <= self.capture_window:
+            return CAPTURE
+        return COUNTDOWN
+
+    def plan(self, session_active, next_capture_time=None, showing_until=0.0, now=None):
+        """
+        Return the imgsz to detect this frame with, or None to skip detection.
+
+        Call once per camera frame; a returned size counts as a detection run.
+        """
+        # Same clock as the session timeline in the apps
+        now = time.time() if now is None else now
+        phase = self.phase(now, session_active, next_capture_time, showing_until)
+        setting = self.settings.get(phase)
+        if setting is None or now - self._last_run < setting[0]:
+            self.skips[phase] += 1
+            return None
+        self._last_run = now
+        self.runs[phase] += 1
+        return setting[1]
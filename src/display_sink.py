@@ -0,0 +1,62 @@
+import time
+import cv2
+
+
+class DisplaySink:
+    """
+    Sends preview frames to a remote display as JPEG, at most `max_fps` per second.
+
+    `send` receives the encoded JPEG bytes (e.g. a Streamlit placeholder's
+    image()). The display rate is independent of the capture/inference
+    rate: frames that arrive before the next display slot are skipped
+    (recording is done separately and still gets every frame). When
+    encoding + sending takes longer than a frame slot, i.e. the browser
+    side falls behind, the next slot is pushed back by that overrun, so the
+    sink sheds frames instead of queuing them.
+
+    Frames are encoded straight from BGR, so no RGB conversion is needed.
+    """
+
+    def __init__(self, send, quality=80, max_fps=15.0):
+        self.send = send
+        self.quality = quality
+        self.max_fps = max_fps
+        self._next_time = 0.0
+        self.sent = 0
+        self.skipped = 0
+        self.last_bytes = 0
+        self.last_send_time = 0.0
+
+    @property
+    def interval(self):
+        return 1.0 / self.max_fps if self.max_fps and self.max_fps > 0 else 0.0
+
+    def due(self, now=None):
+        """True if a frame shown now would be sent (callers can skip preparing it otherwise)."""
+        now = time.monotonic() if now is None else now
+        return now >= self._next_time
+
+    def encode(self, frame):
+        ok, data = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, int(self.quality)])
+        if not ok:
+            raise RuntimeError("JPEG encoding failed")
+        return data.tobytes()
+
+    def show(self, frame, now=None):
+        """Encode and send a BGR frame if a display slot is free; return True if it was sent."""
+        now = time.monotonic() if now is None else now
+        if now < self._next_time:
+            self.skipped += 1
+            return False
+
+        start = time.monotonic()
+        data = self.encode(frame)
+        self.send(data)
+        self.last_send_time = time.monotonic() - start
+        self.last_bytes = len(data)
+        self.sent += 1
+
+        # Next slot one interval after this one; a send slower than that delays it further
+        slot = max(self._next_time, now - self.interval)
+        self._next_time = slot + self.interval + max(self.last_send_time - self.interval, 0.0)
+        return True
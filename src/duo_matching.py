@@ -0,0 +1,129 @@
+import numpy as np
+
+try:
+    from .pose_store import split_reference_name
+    from .pose_index import unique_rows
+except ImportError:
+    from pose_store import split_reference_name
+    from pose_index import unique_rows
+
+class DuoMatcher:
+    """
+    Cocokkan semua orang yang terdeteksi terhadap kedua slot setiap duo sekaligus.
+
+    Referensi `<duo>_person1` dan `<duo>_person2` dari PoseMatcher menjadi slot
+    0 dan 1 sebuah duo (person3 dst. diabaikan: itu biasanya orang di latar).
+    Skor N orang terhadap semua referensi dihitung dalam satu perkalian
+    matriks, lalu untuk tiap duo dipilih pasangan orang->slot terbaik.
+    """
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+        slots = {}
+        for row, name in enumerate(matcher.names):
+            base, person = split_reference_name(str(name))
+            if person in (1, 2):
+                slots.setdefault(base, [-1, -1])[person - 1] = row
+
+        self.duos = np.array(sorted(slots))
+        self.slot_rows = np.array([slots[d] for d in self.duos], dtype=np.int64).reshape(-1, 2)  # (D, 2), -1 = kosong
+        self.has_slot = self.slot_rows >= 0
+        # Baris referensi -> duo, untuk melengkapi kandidat dari index
+        self.row_duo = np.full(len(matcher.names), -1, dtype=np.int64)
+        self.row_duo[self.slot_rows[self.has_slot]] = np.nonzero(self.has_slot)[0]
+        print(f"[INFO] {len(self.duos)} duos, {int(self.has_slot.all(axis=1).sum())} with both people")
+
+    def candidate_duos(self, poses, masks=None):
+        """Indeks duo kandidat dari pose index matcher, atau None kalau matcher tanpa index."""
+        rows = self.matcher.candidate_rows(poses, masks)
+        if rows is None:
+            return None
+        # Index hanya memberi slot yang mirip; slot pasangannya ikut dihitung
+        duos = self.row_duo[rows]
+        return unique_rows(duos[duos >= 0], len(self.duos))
+
+    def score_tensor(self, poses, masks=None, duo_ids=None):
+        """
+        Skor (N, D, 2): orang ke-i terhadap slot ke-s duo ke-d. -inf untuk slot yang tidak ada.
+
+        duo_ids: hanya hitung duo ini (D = len(duo_ids), urutan sama).
+        """
+        if duo_ids is None:
+            slot_rows, has_slot = self.slot_rows, self.has_slot
+            scores = self.matcher.score_rows(poses, masks)          # (N, M)
+            cols = np.maximum(slot_rows, 0)
+        else:
+            slot_rows, has_slot = self.slot_rows[duo_ids], self.has_slot[duo_ids]
+            rows = unique_rows(slot_rows[has_slot], len(self.matcher.names))
+            scores = self.matcher.score_rows(poses, masks, rows)    # (N, len(rows))
+            cols = np.minimum(np.searchsorted(rows, slot_rows), max(len(rows) - 1, 0))
+        if scores.shape[1] == 0:
+            return np.full((scores.shape[0], len(slot_rows), 2), -np.inf, dtype=np.float32)
+        tensor = scores[:, cols]                                   # (N, D, 2)
+        return np.where(has_slot[None], tensor, -np.inf)
+
+    def rank(self, tensor, k=5, duo_ids=None):
+        """
+        Urutkan duo dari tensor skor (N, D, 2).
+
+        Kembalikan list (duo_name, score, (orang_slot1, orang_slot2)) dengan
+        score = rata-rata skor kedua slot untuk penugasan terbaik (i != j).
+        Kalau hanya ada satu orang, atau duo hanya punya satu slot, skor
+        duo adalah skor slot terbaik dan slot lainnya bernilai None.
+        duo_ids: sama dengan yang dipakai di score_tensor.
+        """
+        n, d = tensor.shape[0], tensor.shape[1]
+        if n == 0 or d == 0:
+            return []
+
+        s0, s1 = tensor[:, :, 0], tensor[:, :, 1]                 # (N, D)
+        duos = self.duos if duo_ids is None else self.duos[duo_ids]
+        both = (self.has_slot if duo_ids is None else self.has_slot[duo_ids]).all(axis=1)
+        cols = np.arange(d)
+
+        # Satu slot saja (jumlah orang atau referensi yang kurang)
+        single_slot = np.argmax(np.max(tensor, axis=0), axis=1)    # (D,) slot terbaik
+        single_person = np.argmax(tensor[:, cols, single_slot], axis=0)
+        joint = tensor[single_person, cols, single_slot]
+
+        if n >= 2:
+            pair = s0[:, None, :] + s1[None, :, :]                 # (N, N, D)
+            pair[np.arange(n), np.arange(n)] = -np.inf
+            flat = pair.reshape(n * n, d)
+            best = np.argmax(flat, axis=0)
+            pair_joint = flat[best, cols] / 2
+            joint = np.where(both, pair_joint, joint)
+
+        k = min(k, d)
+        top = np.argpartition(-joint, k - 1)[:k]
+        top = top[np.argsort(-joint[top])]
+
+        # Penugasan orang -> slot hanya dibentuk untuk duo teratas
+        results = []
+        for j in top:
+            if n >= 2 and both[j]:
+                assign = (int(best[j] // n), int(best[j] % n))
+            elif single_slot[j] == 0:
+                assign = (int(single_person[j]), None)
+            else:
+                assign = (None, int(single_person[j]))
+            results.append((str(duos[j]), float(joint[j]), assign))
+        return results
+
+    def match_topk(self, poses, k=5, masks=None):
+        if len(self.duos) == 0:
+            raise RuntimeError("Tidak ada pose referensi yang dimuat!")
+        if len(poses) == 0:
+            return []
+        duo_ids = self.candidate_duos(poses, masks)
+        return self.rank(self.score_tensor(poses, masks, duo_ids), k, duo_ids)
+
+    def match(self, poses, masks=None):
+        """
+        Duo terbaik untuk semua orang di frame: (duo_name, score, (orang_slot1, orang_slot2)).
+
+        None kalau tidak ada orang atau tidak ada kandidat duo, sama seperti
+        StreamingMatcher.best().
+        """
+        top = self.match_topk(poses, k=1, masks=masks)
+        return top[0] if top else None
@@ -0,0 +1,164 @@
+import threading
+import weakref
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+
+class FramePool:
+    """
+    Reusable full-frame buffers with explicit ownership, so the capture -> record path stops allocating per frame.
+
+    acquire() hands out a buffer with one owner (the caller); retain() adds
+    an owner and release() drops one. When the last owner releases it the
+    buffer goes back to the free list for the next acquire() of that shape.
+    Nothing is reclaimed implicitly: a buffer that is never released is
+    simply not reused (it is freed normally once unreferenced, and the pool
+    allocates a new one), so a frame can never be overwritten while someone
+    still holds it. Up to `max_buffers` free buffers are kept per shape.
+    Acquired buffers hold old data: use them as a `dst=` or copy target.
+    """
+
+    def __init__(self, max_buffers=8):
+        self.max_buffers = max_buffers
+        self._free = {}       # (shape, dtype) -> [arrays]
+        self._owners = {}     # id(array) -> [weakref, owner count]
+        # Reentrant: the weakref callback can run from a GC inside a locked section
+        self._lock = threading.RLock()
+        self.allocated = 0
+        self.reused = 0
+
+    def acquire(self, shape, dtype=np.uint8):
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self._lock:
+            free = self._free.get(key)
+            if free:
+                buf = free.pop()
+                self.reused += 1
+            else:
+                buf = np.empty(shape, dtype=dtype)
+                self.allocated += 1
+            key_id = id(buf)
+            self._owners[key_id] = [weakref.ref(buf, lambda _, k=key_id: self._forget(k)), 1]
+            return buf
+
+    def _forget(self, key_id):
+        # A leased buffer was garbage-collected without release()
+        with self._lock:
+            entry = self._owners.get(key_id)
+            if entry is not None and entry[0]() is None:
+                del self._owners[key_id]
+
+    def _entry(self, buf):
+        entry = self._owners.get(id(buf))
+        return entry if entry is not None and entry[0]() is buf else None
+
+    def retain(self, buf):
+        """Add an owner to a pooled buffer (no-op for other arrays); returns buf."""
+        with self._lock:
+            entry = self._entry(buf)
+            if entry is not None:
+                entry[1] += 1
+        return buf
+
+    def release(self, buf):
+        """Drop one owner; the last release makes the buffer reusable. No-op for None and non-pooled arrays."""
+        if buf is None:
+            return
+        with self._lock:
+            entry = self._entry(buf)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self._owners[id(buf)]
+            free = self._free.setdefault((buf.shape, buf.dtype.str), [])
+            if len(free) < self.max_buffers:
+                free.append(buf)
+
+    def copy(self, frame):
+        """Pooled frame.copy(), owned by the caller until release()."""
+        out = self.acquire(frame.shape, frame.dtype)
+        np.copyto(out, frame)
+        return out
+
+    def clear(self):
+        with self._lock:
+            self._free.clear()
+
+
+class FrameRing:
+    """
+    Per-owner ring of `size` buffers that copy() cycles through.
+
+    For frames with a known, short lifetime, e.g. a loop's display frame,
+    which is shown and recorded (the recorder copies) before the next
+    iteration: a buffer is reused `size` copies later, with no release().
+    """
+
+    def __init__(self, size=2):
+        self.size = size
+        self._buffers = []
+        self._next = 0
+
+    def copy(self, frame):
+        buf = self._buffers[self._next] if self._next < len(self._buffers) else None
+        if buf is None or buf.shape != frame.shape or buf.dtype != frame.dtype:
+            buf = np.empty_like(frame)
+            if self._next < len(self._buffers):
+                self._buffers[self._next] = buf
+            else:
+                self._buffers.append(buf)
+        np.copyto(buf, frame)
+        self._next = (self._next + 1) % self.size
+        return buf
+
+
+# Camera frames, shared by camera, inference worker and the apps
+frame_pool = FramePool()
+
+_constant_frames = OrderedDict()
+_constant_lock = threading.Lock()
+MAX_CONSTANT_FRAMES = 32
+
+
+def _cached(key, build):
+    with _constant_lock:
+        frame = _constant_frames.get(key)
+        if frame is not None:
+            _constant_frames.move_to_end(key)
+            return frame
+    frame = build()
+    # Shared between callers: drawing on it must fail loudly
+    frame.flags.writeable = False
+    with _constant_lock:
+        _constant_frames[key] = frame
+        while len(_constant_frames) > MAX_CONSTANT_FRAMES:
+            _constant_frames.popitem(last=False)
+    return frame
+
+
+def constant_frame(shape, value=0, dtype=np.uint8):
+    """Read-only frame filled with `value` (e.g. 255 for the flash, 0 for a blank), cached per resolution."""
+    shape = tuple(shape)
+    return _cached(("fill", shape, value, np.dtype(dtype).str), lambda: np.full(shape, value, dtype=dtype))
+
+
+def text_frame(shape, lines, value=0, font=cv2.FONT_HERSHEY_DUPLEX):
+    """
+    Read-only blank frame with static text, cached per resolution and text.
+
+    lines: tuple of (text, (x, y), scale, color, thickness). Only for fixed
+    messages ("Session Ended", ...); text that changes every time (scores)
+    should be drawn on a pooled copy instead.
+    """
+    shape, lines = tuple(shape), tuple((t, tuple(org), s, tuple(c), th) for t, org, s, c, th in lines)
+
+    def build():
+        frame = np.full(shape, value, dtype=np.uint8)
+        for text, org, scale, color, thickness in lines:
+            cv2.putText(frame, text, org, font, scale, color, thickness, cv2.LINE_AA)
+        return frame
+
+    return _cached(("text", shape, value, font, lines), build)
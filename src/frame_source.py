@@ -0,0 +1,168 @@
+import os
+import time
+import cv2
+
+try:
+    from .camera import Camera
+except ImportError:
+    from camera import Camera
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+class FrameSource:
+    """
+    Camera-compatible frame source that plays back recorded footage.
+
+    read()/get_frame()/release() behave like Camera, so the apps and the
+    booth server can run on a file on a machine without a webcam. With
+    realtime=True frames are paced at the source FPS and, like a live
+    camera, frames that fall due while the caller is busy are skipped
+    (counted in `dropped`), and a read whose next frame is not due within
+    `timeout` returns the current frame again with the same seq instead of
+    sleeping; with realtime=False every frame is returned as fast as the
+    caller reads them, which makes runs deterministic. At the end of the
+    footage read() returns no frame, unless loop=True.
+    """
+
+    def __init__(self, fps, realtime=True, loop=False):
+        self.fps = fps if fps and fps > 0 else 30.0
+        self.realtime = realtime
+        self.loop = loop
+        self.threaded = False
+        self.seq = 0
+        self.position = 0     # frames consumed (returned + dropped) since the first read
+        self.dropped = 0
+        self.width = None
+        self.height = None
+        self._start = None
+        self._done = False
+        self._last = None     # (seq, timestamp, frame) last returned
+        self.last_read_time = 0.0  # seconds the latest decode took (like Camera, no pacing sleep)
+
+    def _next(self, skip):
+        """Skip `skip` frames, then return the next one (None at the end)."""
+        raise NotImplementedError
+
+    def read(self, timeout=1.0, newer_than=None):
+        """
+        Return (seq, timestamp, frame) for the next frame; frame is None at the end of the source.
+
+        In real-time mode this waits at most `timeout` for the next frame to
+        fall due; if it is due later, the current frame is returned again
+        (same seq), like a threaded Camera with no new frame yet.
+        `newer_than` is accepted for Camera compatibility.
+        """
+        if self._done:
+            return self.seq, time.monotonic(), None
+
+        skip = 0
+        if self.realtime:
+            now = time.monotonic()
+            if self._start is None:
+                self._start = now
+            due = self._start + self.position / self.fps
+            if due > now:
+                if self._last is not None and due - now > timeout:
+                    time.sleep(max(timeout, 0.0))
+                    return self._last
+                time.sleep(due - now)
+            else:
+                skip = max(int((now - self._start) * self.fps) - self.position, 0)
+
+        start = time.perf_counter()
+        frame = self._next(skip)
+        self.last_read_time = time.perf_counter() - start
+        if frame is None:
+            self._done = True
+            return self.seq, time.monotonic(), None
+        self.position += skip + 1
+        self.dropped += skip
+        self.seq += 1
+        self.height, self.width = frame.shape[:2]
+        self._last = (self.seq, time.monotonic(), frame)
+        return self._last
+
+    def get_frame(self):
+        return self.read()[2]
+
+    def release(self):
+        self._done = True
+
+
+class VideoFileSource(FrameSource):
+    """Frames from a video file (e.g. a recorded booth session)."""
+
+    def __init__(self, path, realtime=True, loop=False, fps=None):
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"Cannot open video file: {path}")
+        super().__init__(fps or self.cap.get(cv2.CAP_PROP_FPS), realtime, loop)
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    def _rewind(self):
+        if not self.loop:
+            return False
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        return True
+
+    def _next(self, skip):
+        for _ in range(skip):
+            # grab() skips decoding the frames nobody looks at
+            if not self.cap.grab() and not (self._rewind() and self.cap.grab()):
+                return None
+        ret, frame = self.cap.read()
+        if not ret and self._rewind():
+            ret, frame = self.cap.read()
+        return frame if ret else None
+
+    def release(self):
+        super().release()
+        self.cap.release()
+
+
+class ImageDirSource(FrameSource):
+    """Frames from a directory of images, in file name order, at a fixed FPS."""
+
+    def __init__(self, path, realtime=True, loop=False, fps=30.0):
+        self.path = path
+        self.files = sorted(os.path.join(path, f) for f in os.listdir(path)
+                            if f.lower().endswith(IMAGE_EXTENSIONS))
+        if not self.files:
+            raise RuntimeError(f"No images found in {path}")
+        super().__init__(fps, realtime, loop)
+        self.index = 0
+
+    def _next(self, skip):
+        self.index += skip
+        # At most one full pass: with loop=True and no readable image this must still end
+        for _ in range(len(self.files)):
+            if self.index >= len(self.files):
+                if not self.loop:
+                    return None
+                self.index %= len(self.files)
+            frame = cv2.imread(self.files[self.index])
+            self.index += 1
+            if frame is not None:
+                return frame
+            print(f"[WARNING] Cannot read image: {self.files[self.index - 1]}")
+        print(f"[ERROR] No readable image in {self.path}")
+        return None
+
+
+def open_source(spec=None, realtime=True, loop=False, **camera_kwargs):
+    """
+    Open a frame source from a spec string: a camera index ("0", default), a video file or an image directory.
+
+    Cameras are opened threaded (newest-frame capture); camera_kwargs go to Camera.
+    """
+    if spec is None or str(spec).strip().isdigit():
+        camera_kwargs.setdefault("threaded", True)
+        return Camera(device=int(spec or 0), **camera_kwargs)
+    if os.path.isdir(spec):
+        return ImageDirSource(spec, realtime, loop)
+    if os.path.isfile(spec):
+        return VideoFileSource(spec, realtime, loop)
+    raise FileNotFoundError(f"Frame source not found: {spec}")
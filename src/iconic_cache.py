@@ -0,0 +1,80 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+class IconicImageCache:
+    """
+    Decoded iconic images, already resized to the display size, in a memory-capped LRU.
+
+    The base-name -> path index is built once, so a lookup never touches the
+    disk unless the image is not cached yet. Returned images are shared and
+    read-only: copy them before drawing on them.
+    """
+
+    def __init__(self, image_dir, max_bytes=64 * 1024 * 1024):
+        self.image_dir = image_dir
+        self.max_bytes = max_bytes
+        self.index = {}
+        if os.path.isdir(image_dir):
+            for f in sorted(os.listdir(image_dir)):
+                if f.lower().endswith(IMAGE_EXTENSIONS):
+                    self.index.setdefault(os.path.splitext(f)[0], os.path.join(image_dir, f))
+
+        self._images = OrderedDict()  # (base_name, (width, height)) -> image
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="IconicPrefetch")
+        print(f"[INFO] Indexed {len(self.index)} iconic images from {image_dir}")
+
+    def find(self, base_name):
+        """Path of the image for a duo base name (exact match first, then prefix like before)."""
+        path = self.index.get(base_name)
+        if path is None:
+            for name in sorted(self.index):
+                if name.startswith(base_name):
+                    return self.index[name]
+        return path
+
+    def get(self, base_name, size):
+        """Return the image for `base_name` resized to size=(width, height), or None if missing."""
+        key = (base_name, tuple(size))
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                return image
+
+        path = self.find(base_name)
+        if path is None:
+            return None
+        image = cv2.imread(path)
+        if image is None:
+            print(f"[WARNING] Failed to read iconic image: {path}")
+            return None
+        image = cv2.resize(image, key[1])
+        image.flags.writeable = False
+
+        with self._lock:
+            if key not in self._images:
+                self._images[key] = image
+                self._bytes += image.nbytes
+                while self._bytes > self.max_bytes and len(self._images) > 1:
+                    _, evicted = self._images.popitem(last=False)
+                    self._bytes -= evicted.nbytes
+            return self._images.get(key, image)
+
+    def prefetch(self, base_names, size):
+        """Decode and resize candidates in the background (e.g. the current top-k matches)."""
+        for base_name in base_names:
+            if (base_name, tuple(size)) not in self._images:
+                self._prefetcher.submit(self.get, base_name, size)
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self._bytes = 0
@@ -0,0 +1,288 @@
+import os
+import argparse
+import numpy as np
+import cv2
+
+NUM_KEYPOINTS = 17
+
+# Backend selection when PoseDetector(backend=None): this env var, else "ultralytics"
+BACKEND_ENV = "TWINBROS_BACKEND"
+MODEL_ENV = "TWINBROS_MODEL"
+
+DEFAULT_MODELS = {
+    "ultralytics": "yolo11n-pose.pt",
+    "onnx": "yolo11n-pose.onnx",
+    "openvino": "yolo11n-pose_openvino_model",
+}
+
+# Same defaults as ultralytics predict(), so every backend returns the same people
+DET_CONF = 0.25
+NMS_IOU = 0.7
+MAX_DET = 300
+
+
+def letterbox(image, size):
+    """
+    Resize keeping the aspect ratio and pad to (size, size) with gray 114, like ultralytics.
+
+    Return (padded image, scale, (pad_x, pad_y)).
+    """
+    h, w = image.shape[:2]
+    scale = min(size / h, size / w)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    pad_x, pad_y = (size - new_w) / 2, (size - new_h) / 2
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, left = int(round(pad_y - 0.1)), int(round(pad_x - 0.1))
+    bottom, right = size - new_h - top, size - new_w - left
+    padded = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return padded, scale, (left, top)
+
+
+def to_blob(image):
+    """BGR uint8 (H, W, 3) -> RGB float32 (1, 3, H, W) in [0, 1]."""
+    blob = cv2.cvtColor(image, cv2.COLOR_BGR2RGB).astype(np.float32) / 255.0
+    return np.ascontiguousarray(blob.transpose(2, 0, 1)[None])
+
+
+def nms(boxes, scores, iou_thresh=NMS_IOU, max_det=MAX_DET):
+    """Greedy non-maximum suppression on xyxy boxes; return kept indices, best score first."""
+    order = np.argsort(-scores)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while order.size and len(keep) < max_det:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        xx0 = np.maximum(boxes[i, 0], boxes[rest, 0])
+        yy0 = np.maximum(boxes[i, 1], boxes[rest, 1])
+        xx1 = np.minimum(boxes[i, 2], boxes[rest, 2])
+        yy1 = np.minimum(boxes[i, 3], boxes[rest, 3])
+        inter = np.clip(xx1 - xx0, 0, None) * np.clip(yy1 - yy0, 0, None)
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-9)
+        order = rest[iou <= iou_thresh]
+    return np.array(keep, dtype=np.int64)
+
+
+def decode_pose_output(output, scale, pad, image_shape, conf=DET_CONF, iou=NMS_IOU):
+    """
+    Decode a raw YOLO pose head output (1, 56, A) into keypoints (N, 17, 3) in image pixels.
+
+    Rows are cx, cy, w, h, person score, then x, y, visibility for each of
+    the 17 COCO joints (score and visibility are already sigmoid-ed in the
+    exported graph). People are sorted by score, like ultralytics.
+    """
+    pred = np.asarray(output, dtype=np.float32).reshape(5 + NUM_KEYPOINTS * 3, -1).T   # (A, 56)
+    pred = pred[pred[:, 4] > conf]
+    if len(pred) == 0:
+        return np.zeros((0, NUM_KEYPOINTS, 3), dtype=np.float32)
+
+    cx, cy, w, h = pred[:, 0], pred[:, 1], pred[:, 2], pred[:, 3]
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+    keep = nms(boxes, pred[:, 4], iou)
+
+    kpts = pred[keep, 5:].reshape(-1, NUM_KEYPOINTS, 3).copy()
+    kpts[:, :, 0] = np.clip((kpts[:, :, 0] - pad[0]) / scale, 0, image_shape[1])
+    kpts[:, :, 1] = np.clip((kpts[:, :, 1] - pad[1]) / scale, 0, image_shape[0])
+    return kpts
+
+
+class UltralyticsBackend:
+    """The original PyTorch path through ultralytics YOLO."""
+
+    name = "ultralytics"
+
+    def __init__(self, model_path=DEFAULT_MODELS["ultralytics"]):
+        from ultralytics import YOLO
+        self.model = YOLO(model_path)
+
+    def prepare(self):
+        # Fuse Conv+BN once up front (see SharedPoseDetector)
+        self.model.fuse()
+
+    def _predict(self, source, imgsz=None, conf=None):
+        kwargs = {}
+        if imgsz is not None:
+            kwargs["imgsz"] = imgsz
+        if conf is not None:
+            kwargs["conf"] = conf
+        return self.model.predict(source=source, verbose=False, **kwargs)
+
+    @staticmethod
+    def _keypoints(result):
+        if result.keypoints is None:
+            return None
+        kps = result.keypoints
+        xy = kps.xy.cpu().numpy()
+        conf = kps.conf.cpu().numpy() if kps.conf is not None else np.ones(xy.shape[:2], dtype=np.float32)
+        return np.concatenate([xy, conf[:, :, None]], axis=2).astype(np.float32)
+
+    def predict(self, frame, imgsz=None, conf=None):
+        """Keypoints (N, 17, 3) x, y, confidence in frame pixels, or None."""
+        results = self._predict(frame, imgsz, conf)
+        if len(results) == 0:
+            return None
+        return self._keypoints(results[0])
+
+    def predict_batch(self, frames, imgsz=None, conf=None):
+        """predict() for several frames in one forward pass; one entry per frame."""
+        return [self._keypoints(r) for r in self._predict(list(frames), imgsz, conf)]
+
+
+class _ExportedBackend:
+    """Shared letterbox -> run -> decode flow for exported graphs (ONNX, OpenVINO)."""
+
+    model = None
+
+    def __init__(self, imgsz=640, conf=DET_CONF, iou=NMS_IOU):
+        self.imgsz = imgsz
+        self.dynamic = False          # input size can change per call
+        self.dynamic_batch = False    # several frames per call
+        self.conf = conf
+        self.iou = iou
+
+    def prepare(self):
+        pass
+
+    def _input_size(self, imgsz):
+        if imgsz is None or not self.dynamic:
+            # A static graph only accepts the size it was exported with
+            return self.imgsz
+        return max(32, int(round(imgsz / 32)) * 32)
+
+    def predict(self, frame, imgsz=None, conf=None):
+        padded, scale, pad = letterbox(frame, self._input_size(imgsz))
+        output = self._run(to_blob(padded))
+        return decode_pose_output(output, scale, pad, frame.shape, conf or self.conf, self.iou)
+
+    def predict_batch(self, frames, imgsz=None, conf=None):
+        if not self.dynamic_batch:
+            return [self.predict(frame, imgsz, conf) for frame in frames]
+        size = self._input_size(imgsz)
+        boxed = [letterbox(frame, size) for frame in frames]
+        outputs = self._run(np.concatenate([to_blob(padded) for padded, _, _ in boxed]))
+        return [decode_pose_output(output, scale, pad, frame.shape, conf or self.conf, self.iou)
+                for output, (_, scale, pad), frame in zip(outputs, boxed, frames)]
+
+
+class OnnxBackend(_ExportedBackend):
+    """ONNX Runtime on CPU for an exported yolo11n-pose.onnx (optionally INT8, see quantize_onnx)."""
+
+    name = "onnx"
+
+    def __init__(self, model_path=DEFAULT_MODELS["onnx"], threads=None, **kwargs):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        shape = self.session.get_inputs()[0].shape     # [1, 3, H, W], strings when dynamic
+        super().__init__(**kwargs)
+        if isinstance(shape[2], int):
+            self.imgsz = shape[2]
+        else:
+            self.dynamic = True
+        self.dynamic_batch = not isinstance(shape[0], int)
+
+    def _run(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVinoBackend(_ExportedBackend):
+    """OpenVINO on CPU for an exported yolo11n-pose_openvino_model/ (FP32 or INT8)."""
+
+    name = "openvino"
+
+    def __init__(self, model_path=DEFAULT_MODELS["openvino"], threads=None, **kwargs):
+        import openvino as ov
+        if os.path.isdir(model_path):
+            xml = [f for f in os.listdir(model_path) if f.endswith(".xml")]
+            if not xml:
+                raise FileNotFoundError(f"No OpenVINO .xml model in {model_path}")
+            model_path = os.path.join(model_path, xml[0])
+        core = ov.Core()
+        config = {"PERFORMANCE_HINT": "LATENCY"}
+        if threads:
+            config["INFERENCE_NUM_THREADS"] = threads
+        model = core.read_model(model_path)
+        super().__init__(**kwargs)
+        shape = model.inputs[0].get_partial_shape()
+        if shape[2].is_static:
+            self.imgsz = shape[2].get_length()
+        else:
+            self.dynamic = True
+        self.dynamic_batch = shape[0].is_dynamic
+        self.compiled = core.compile_model(model, "CPU", config)
+        self.request = self.compiled.create_infer_request()
+
+    def _run(self, blob):
+        self.request.infer({0: blob})
+        return self.request.get_output_tensor(0).data.copy()
+
+
+BACKENDS = {
+    "ultralytics": UltralyticsBackend,
+    "onnx": OnnxBackend,
+    "openvino": OpenVinoBackend,
+}
+
+
+def create_backend(backend=None, model_path=None, **kwargs):
+    """
+    Build an inference backend by name: "ultralytics" (default), "onnx" or "openvino".
+
+    Without arguments the TWINBROS_BACKEND and TWINBROS_MODEL environment
+    variables decide, so booth PCs can switch runtime without code changes.
+    """
+    backend = (backend or os.environ.get(BACKEND_ENV) or "ultralytics").lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend} (choose from {', '.join(BACKENDS)})")
+    model_path = model_path or os.environ.get(MODEL_ENV) or DEFAULT_MODELS[backend]
+    print(f"[INFO] Pose backend: {backend} ({model_path})")
+    if backend == "ultralytics":
+        return UltralyticsBackend(model_path)
+    return BACKENDS[backend](model_path, **kwargs)
+
+
+def quantize_onnx(onnx_path, output_path=None):
+    """Dynamic INT8 quantization of an ONNX model (weights to INT8, no calibration data needed)."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    output_path = output_path or os.path.splitext(onnx_path)[0] + "-int8.onnx"
+    quantize_dynamic(onnx_path, output_path, weight_type=QuantType.QUInt8)
+    print(f"[INFO] INT8 model saved: {output_path}")
+    return output_path
+
+
+def export_model(model_path=DEFAULT_MODELS["ultralytics"], fmt="onnx", imgsz=640, dynamic=False,
+                 int8=False, data=None):
+    """
+    Export the PyTorch model for a CPU runtime and return the exported path.
+
+    ONNX INT8 uses dynamic quantization (quantize_onnx); OpenVINO INT8 uses
+    ultralytics/NNCF post-training quantization with `data` as calibration set.
+    """
+    from ultralytics import YOLO
+    model = YOLO(model_path)
+    if fmt == "onnx":
+        path = model.export(format="onnx", imgsz=imgsz, dynamic=dynamic, simplify=True)
+        return quantize_onnx(path) if int8 else path
+    if fmt == "openvino":
+        kwargs = {"data": data} if data else {}
+        return model.export(format="openvino", imgsz=imgsz, dynamic=dynamic, int8=int8, **kwargs)
+    raise ValueError(f"Unknown export format: {fmt}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export yolo11n-pose for ONNX Runtime or OpenVINO.")
+    parser.add_argument("--model", default=DEFAULT_MODELS["ultralytics"], help="PyTorch model to export")
+    parser.add_argument("--format", choices=["onnx", "openvino"], default="onnx")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--dynamic", action="store_true",
+                        help="Dynamic input size (needed for DetectionScheduler imgsz changes)")
+    parser.add_argument("--int8", action="store_true", help="INT8 quantization")
+    parser.add_argument("--data", default=None, help="Calibration dataset yaml for OpenVINO INT8")
+    args = parser.parse_args()
+
+    export_model(args.model, args.format, args.imgsz, args.dynamic, args.int8, args.data)
@@ -0,0 +1,108 @@
+import threading
+import time
+
+try:
+    from .frame_pool import frame_pool
+except ImportError:
+    from frame_pool import frame_pool
+
+class AsyncPoseInference:
+    """
+    Runs pose detection in a worker thread, always on the latest submitted frame.
+
+    The render loop calls submit() with every camera frame and latest() to get
+    the newest finished keypoints. Frames that arrive while the detector is busy
+    replace the pending one, so inference never falls behind the camera; the
+    result is tagged with the sequence number of the frame it came from.
+
+    A thread (not a process) is enough here: ultralytics/torch release the GIL
+    during inference, and the model is loaded only once.
+
+    Submitted frames are retained in frame_pool until the worker is done with
+    them (or they are replaced), so the camera never reuses a buffer the
+    worker may still read.
+    """
+
+    def __init__(self, detector):
+        self.detector = detector
+        self._cond = threading.Condition()
+        self._pending = None          # (seq, frame, roi, imgsz) waiting for the worker
+        self._result = (0, None)      # (seq, keypoints) of the newest finished frame
+        self.frames_submitted = 0
+        self.frames_inferred = 0
+        self.last_latency = 0.0
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="PoseInference", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and self._running:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                seq, frame, roi, imgsz = self._pending
+                self._pending = None
+
+            start = time.monotonic()
+            try:
+                if roi is None and imgsz is None:
+                    keypoints = self.detector.get_keypoints(frame)
+                else:
+                    keypoints = self.detector.get_keypoints(frame, roi, imgsz)
+            except Exception as e:
+                print(f"[ERROR] Pose inference failed: {e}")
+                keypoints = None
+            frame_pool.release(frame)
+
+            with self._cond:
+                self._result = (seq, keypoints)
+                self.frames_inferred += 1
+                self.last_latency = time.monotonic() - start
+                self._cond.notify_all()
+
+    def submit(self, seq, frame, roi=None, imgsz=None):
+        """
+        Queue a frame for inference, dropping any frame still waiting. The frame must not be modified afterwards.
+
+        roi=(x0, y0, x1, y1) limits detection to that region (see PoseTracker.roi);
+        imgsz overrides the model input size for this frame (see DetectionScheduler).
+        A full-frame job that is still waiting is never downgraded to an ROI
+        job: the newer frame then runs on the full frame instead, so the
+        periodic full-frame refresh (newcomers) survives a busy worker.
+        """
+        frame_pool.retain(frame)
+        with self._cond:
+            if self._pending is not None:
+                if roi is not None and self._pending[2] is None:
+                    roi = None
+                frame_pool.release(self._pending[1])
+            self._pending = (seq, frame, roi, imgsz)
+            self.frames_submitted += 1
+            self._cond.notify_all()
+
+    def latest(self):
+        """Return (seq, keypoints) for the most recent finished inference."""
+        with self._cond:
+            return self._result
+
+    def wait_for(self, seq, timeout=1.0):
+        """Block until a result for frame `seq` (or newer) is ready; returns (seq, keypoints)."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._result[0] < seq and self._running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return self._result
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            if self._pending is not None:
+                frame_pool.release(self._pending[1])
+                self._pending = None
+            self._cond.notify_all()
+        self._thread.join(timeout=2.0)
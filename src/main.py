@@ -1,22 +1,34 @@
 import cv2
-import numpy as np
 import time
 import os
-from camera import Camera
+import argparse
+from frame_source import open_source
 from ui import UI
 from transition import Transition
-from pose_detection import PoseDetector
+from pose_detection import get_shared_detector
 from pose_matching import PoseMatcher
+from duo_matching import DuoMatcher
 from audio import AudioManager
-from video_recorder import VideoRecorder
+from video_recorder import VideoRecorder, DROP_OLDEST
+from inference_worker import AsyncPoseInference
+from iconic_cache import IconicImageCache
+from streaming_match import StreamingMatcher
+from tracker import PoseTracker
+from detection_scheduler import DetectionScheduler
+from metrics import LoopMetrics
+from frame_pool import frame_pool, FrameRing, text_frame
 
-def main():
-    cam = Camera()
-    ui = UI()
+def main(source=None, realtime=True, loop=False, headless=False, auto_start=False,
+         metrics_overlay=False, metrics_dir=None):
+    # source: camera index, video file or image directory (see frame_source.open_source)
+    # metrics_dir: write metrics.jsonl + twinbros.prom there every 10 s
+    cam = open_source(source, realtime, loop)
+    ui = UI(headless)
     trans = Transition(ui)
 
-    detector = PoseDetector()          # load YOLO once
-    matcher = PoseMatcher()            # load reference poses once
+    detector = get_shared_detector()   # load, fuse and warm up YOLO once
+    matcher = PoseMatcher(scoring="procrustes")  # rotation/mirror tolerant scoring
+    duo_matcher = DuoMatcher(matcher)  # pair <duo>_person1/2 references
     
     # Initialize Audio and Video
     base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -24,7 +36,8 @@ def main():
     output_dir = os.path.join(base_dir, "output")
     
     audio_manager = AudioManager(sound_dir)
-    video_recorder = VideoRecorder(output_dir)
+    # Async: encoding runs on its own thread instead of inside the session loop
+    video_recorder = VideoRecorder(output_dir, async_mode=True, full_policy=DROP_OLDEST)
 
     print("=== TwinBros Pose Matching App ===")
     print("[INFO] Tekan 's' untuk mulai sesi, 'q' untuk keluar.")
@@ -32,29 +45,114 @@ def main():
 
     SESSION_DURATION = 15  # seconds
     POSE_INTERVAL = 3      # seconds
-    
+    # Pipeline mode: YOLO runs in a worker thread on the newest frame, so the
+    # preview and recording run at camera rate instead of inference rate.
+    ASYNC_INFERENCE = True
+    # Detect only around tracked people (more pixels per person), with a
+    # full-frame pass every FULL_FRAME_EVERY frames to pick up newcomers.
+    ROI_REDETECTION = False
+    FULL_FRAME_EVERY = 15
+    # Low rate / low imgsz in standby and early countdown, full rate and
+    # resolution only in the last second before a capture.
+    ADAPTIVE_DETECTION = True
+
+    inference = AsyncPoseInference(detector) if ASYNC_INFERENCE else None
+    seq = 0
+    # Matches every new inference result; the capture just reads the smoothed best
+    streaming = StreamingMatcher(duo_matcher)
+    tracker = PoseTracker()  # stable person IDs across frames
+    scheduler = DetectionScheduler() if ADAPTIVE_DETECTION else None
+    state = {"detections": 0, "keypoints": None, "kp_seq": 0, "streamed_seq": None, "frame": None}
+    displays = FrameRing()  # display copies, shown and recorded before the buffer comes round again
+    # Per-stage latency + FPS; always on, exports only with metrics_dir
+    metrics = LoopMetrics(jsonl_path=os.path.join(metrics_dir, "metrics.jsonl") if metrics_dir else None,
+                          prom_path=os.path.join(metrics_dir, "twinbros.prom") if metrics_dir else None)
+
+    def read_frame(last_seq, session_active=False, next_capture_time=None):
+        """Return (seq, frame, keypoints, keypoints_seq) for the next camera frame."""
+        # Waiting for the camera is idle time, not capture cost: that is timed on the capture side
+        with metrics.stage("wait"):
+            seq, timestamp, frame = cam.read(newer_than=last_seq)
+        # Done with the previous camera frame (the inference worker retains its own)
+        frame_pool.release(state["frame"])
+        state["frame"] = frame
+        if frame is None:
+            return seq, None, None, seq
+        metrics.count("capture")
+        metrics.record("capture", cam.last_read_time)
+        metrics.record("frame_age", time.monotonic() - timestamp)
+
+        imgsz, run_detection = None, True
+        if scheduler is not None:
+            imgsz = scheduler.plan(session_active, next_capture_time)
+            run_detection = imgsz is not None
+
+        # Skipped frames keep the previous keypoints
+        if run_detection:
+            roi = None
+            if ROI_REDETECTION and state["detections"] % FULL_FRAME_EVERY != 0:
+                roi = tracker.roi(frame.shape)
+            state["detections"] += 1
+            if inference is not None:
+                # The worker reads `frame` concurrently, so it is never drawn on.
+                inference.submit(seq, frame, roi, imgsz)
+            else:
+                with metrics.stage("inference"):
+                    state["keypoints"], state["kp_seq"] = detector.get_keypoints(frame, roi, imgsz), seq
+        if inference is not None:
+            state["kp_seq"], state["keypoints"] = inference.latest()
+        kp_seq, keypoints = state["kp_seq"], state["keypoints"]
+
+        if kp_seq != state["streamed_seq"]:
+            state["streamed_seq"] = kp_seq
+            metrics.count("inference")
+            if inference is not None:
+                # Timed on the worker thread
+                metrics.record("inference", inference.last_latency)
+            with metrics.stage("match"):
+                track_ids = tracker.update(keypoints)
+                streaming.update(*detector.normalize_people(keypoints), track_ids=track_ids)
+        return seq, frame, keypoints, kp_seq
+
+    def present(display, draw_start):
+        """Show a finished frame and return the key pressed; draw_start is when drawing on it began."""
+        metrics.record("draw", time.perf_counter() - draw_start)
+        if metrics_overlay:
+            metrics.draw(display)
+        with metrics.stage("display"):
+            key = ui.show(display)
+        metrics.count("render")
+        metrics.maybe_export()
+        return key
+
     # Pre-load iconic images mapping
     iconic_img_dir = os.path.join(base_dir, "data", "iconic_images")
+    iconic_cache = IconicImageCache(iconic_img_dir)
+    run_start, frames_shown = time.monotonic(), 0
     
     while True:
-        frame, keypoints = cam.get_frame()
+        seq, frame, keypoints, _ = read_frame(seq)
         if frame is None:
-            print("[ERROR] Kamera tidak tersedia.")
+            if source is None or str(source).isdigit():
+                print("[ERROR] Kamera tidak tersedia.")
+            else:
+                print("[INFO] Sumber video selesai.")
             break
+        frames_shown += 1
+        draw_start = time.perf_counter()
+        display = displays.copy(frame)  # reused buffer, no per-frame allocation
 
-        # Draw YOLO keypoints
+        # Draw YOLO keypoints (all people at once)
         if keypoints is not None:
-            for person in keypoints:
-                for (x, y, conf) in person:
-                    if conf > 0.5:
-                        cv2.circle(frame, (int(x), int(y)), 3, (0, 255, 0), -1)
+            keypoints.draw(display)
 
-        ui.overlay_text(frame, "Press 'S' to Start | 'Q' to Quit", (20, 460))
-        ui.overlay_text(frame, f"Music (< A/D >): {audio_manager.get_current_track_name()}", (20, 430), scale=0.6)
+        ui.overlay_text(display, "Press 'S' to Start | 'Q' to Quit", (20, 460))
+        ui.overlay_text(display, f"Music (< A/D >): {audio_manager.get_current_track_name()}", (20, 430), scale=0.6)
         
-        cv2.imshow("TwinBros", frame)
-
-        key = cv2.waitKeyEx(1)
+        key = present(display, draw_start)
+        if auto_start:
+            # Headless runs: start one session right away instead of waiting for 'S'
+            key, auto_start = ord('s'), False
         if key == ord('q'):
             break
         
@@ -70,56 +168,66 @@ def main():
             
             # Start Music and Recording
             audio_manager.play()
-            video_path = video_recorder.start(frame.shape[1], frame.shape[0])
+            # Every frame of the session (flash, messages, results) uses the stream's size
+            shape = frame.shape
+            video_path = video_recorder.start(shape[1], shape[0])
             
             start_time = time.time()
             next_capture_time = start_time + POSE_INTERVAL
+            prefetched_for = None
+            streaming.reset()
             
             while (time.time() - start_time) < SESSION_DURATION:
-                frame, keypoints = cam.get_frame()
+                seq, frame, keypoints, _ = read_frame(seq, True, next_capture_time)
                 if frame is None: break
+                frames_shown += 1
                 
                 # Record frame
-                video_recorder.write(frame)
+                with metrics.stage("record"):
+                    video_recorder.write(frame)
+                draw_start = time.perf_counter()
+                display = displays.copy(frame)
                 
                 remaining_time = int(SESSION_DURATION - (time.time() - start_time))
-                ui.overlay_text(frame, f"Session Time: {remaining_time}s", (20, 50), color=(255, 255, 255))
+                ui.overlay_text(display, f"Session Time: {remaining_time}s", (20, 50), color=(255, 255, 255))
                 
                 # Show countdown to next capture
                 time_to_capture = next_capture_time - time.time()
                 if time_to_capture > 0:
-                     ui.overlay_text(frame, f"Next Pose in: {int(time_to_capture)+1}", (20, 100), color=(255, 255, 255))
+                     ui.overlay_text(display, f"Next Pose in: {int(time_to_capture)+1}", (20, 100), color=(255, 255, 255))
+
+                # Live hint from the smoothed scores
+                closest = streaming.best()
+                if closest is not None:
+                    ui.overlay_text(display, f"Closest: {closest[0]} ({closest[1]:.2f})", (20, 150), scale=0.6)
+
+                # Last second before capture: warm the image cache with the current top-k
+                if time_to_capture <= 1.0 and prefetched_for != next_capture_time and streaming.top():
+                    prefetched_for = next_capture_time
+                    iconic_cache.prefetch([duo for duo, _, _ in streaming.top(5)], (shape[1], shape[0]))
 
                 # Draw keypoints
                 if keypoints is not None:
-                    for person in keypoints:
-                        for (x, y, conf) in person:
-                            if conf > 0.5:
-                                cv2.circle(frame, (int(x), int(y)), 3, (0, 255, 0), -1)
+                    keypoints.draw(display)
 
-                cv2.imshow("TwinBros", frame)
-                key = cv2.waitKey(1)
+                key = present(display, draw_start)
                 
                 if time.time() >= next_capture_time:
+                    # Already computed: smoothed over the last frames, so a blink
+                    # or one bad detection at this instant does not decide it
+                    best = streaming.best()
+
                     # Capture!
-                    trans.flash_effect(video_recorder)
+                    trans.flash_effect(video_recorder, shape)
                     print("[INFO] Capturing pose...")
                     
-                    if keypoints and len(keypoints) > 0:
-                        person = keypoints[0]
-                        coords = np.array(person)[:, :2]
-                        norm_pose = detector.normalize_pose(coords)
-                        
-                        best_name, best_score = matcher.match(norm_pose)
-                        print(f"[OK] Match found: {best_name} (Score: {best_score:.2f})")
+                    if best is not None:
+                        # Everyone in frame is matched against both people of every duo
+                        base_name, best_score, assignment = best
+                        print(f"[OK] Match found: {base_name} (Score: {best_score:.2f}, people {assignment})")
                         
-                        # Find iconic image
-                        base_name = best_name.split("_person")[0]
-                        image_path = None
-                        for f in os.listdir(iconic_img_dir):
-                            if f.startswith(base_name):
-                                image_path = os.path.join(iconic_img_dir, f)
-                                break
+                        # Find iconic image (decoded + resized, usually already cached)
+                        match_img = iconic_cache.get(base_name, (shape[1], shape[0]))
                         
                         # Pause recording briefly if we want to show the result in the video? 
                         # Or just show it on screen. The recorder captures frames from the loop.
@@ -129,22 +237,24 @@ def main():
                         # To record the result overlay, we would need to modify show_match_result to return the image or handle recording internally.
                         # For now, let's accept that the result display is a "pause" in the session flow.
                         
-                        ui.show_match_result(image_path, base_name, best_score, duration=2000, video_recorder=video_recorder)
+                        ui.show_match_result(None, base_name, best_score, duration=2000,
+                                             video_recorder=video_recorder, image=match_img, shape=shape)
                         
                         next_capture_time = time.time() + POSE_INTERVAL
+                        streaming.reset()
                         
                     else:
                         print("[INFO] Tidak ada pose terdeteksi.")
-                        ui.transition_message("No Pose Detected", 1000, video_recorder)
+                        ui.transition_message("No Pose Detected", 1000, video_recorder, shape)
                         next_capture_time = time.time() + POSE_INTERVAL
 
             print("[INFO] Session ended.")
             
             # Stop Music and Recording
             audio_manager.stop()
-            video_recorder.stop()
+            video_recorder.stop(wait=False)
             
-            ui.transition_message("Session Ended", 2000, video_recorder)
+            ui.transition_message("Session Ended", 2000, video_recorder, shape)
             
             # Drive Upload Message
             drive_link = "https://drive.google.com/drive/folders/1Knv2PaaFLN57YNlExWAAgRxrw-eAakg5?usp=sharing"
@@ -152,16 +262,39 @@ def main():
             print(f"[IMPORTANT] Please upload the video to Google Drive: {drive_link}\n")
             
             # Show message on UI
-            blank = np.zeros((480, 640, 3), dtype=np.uint8)
-            cv2.putText(blank, "Video Saved!", (200, 200), ui.font, 1, (255, 255, 255), 2)
-            cv2.putText(blank, "Upload to Drive", (180, 250), ui.font, 0.8, (255, 255, 255), 1)
-            cv2.imshow("TwinBros", blank)
-            cv2.waitKey(3000)
+            blank = text_frame(shape, [("Video Saved!", ui.scaled_pos(shape, (200, 200)), 1, (255, 255, 255), 2),
+                                       ("Upload to Drive", ui.scaled_pos(shape, (180, 250)), 0.8, (255, 255, 255), 1)],
+                               font=ui.font)
+            ui.show(blank, 3000)
 
+    elapsed = time.monotonic() - run_start
+    print(f"[INFO] {frames_shown} frames in {elapsed:.1f}s ({frames_shown / max(elapsed, 1e-6):.1f} FPS), "
+          f"{state['detections']} detections")
+    for name, s in metrics.snapshot()["stages"].items():
+        print(f"[INFO]   {name:<10} p50 {s['p50']:.1f} ms, p95 {s['p95']:.1f} ms, p99 {s['p99']:.1f} ms")
+    metrics.flush()
+    if inference is not None:
+        inference.stop()
+    video_recorder.join()
     cam.release()
-    cv2.destroyAllWindows()
+    if not headless:
+        cv2.destroyAllWindows()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="TwinBros pose matching booth.")
+    parser.add_argument("--source", default=None,
+                        help="Camera index (default 0), video file or image directory")
+    parser.add_argument("--fast", action="store_true",
+                        help="Play file sources as fast as possible instead of at their FPS")
+    parser.add_argument("--loop", action="store_true", help="Restart file sources at the end")
+    parser.add_argument("--headless", action="store_true", help="No window; waits become sleeps")
+    parser.add_argument("--auto-start", action="store_true", help="Start a session on the first frame")
+    parser.add_argument("--metrics-overlay", action="store_true", help="Draw FPS and stage latencies on the preview")
+    parser.add_argument("--metrics-dir", default=None,
+                        help="Export metrics.jsonl and a Prometheus textfile (twinbros.prom) here")
+    args = parser.parse_args()
+
+    main(args.source, realtime=not args.fast, loop=args.loop, headless=args.headless, auto_start=args.auto_start,
+         metrics_overlay=args.metrics_overlay, metrics_dir=args.metrics_dir)
 
 
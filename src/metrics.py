@@ -0,0 +1,174 @@
+import os
+import json
+import time
+from collections import deque
+import cv2
+import numpy as np
+
+QUANTILES = (50, 95, 99)
+
+
+class _Stage:
+    """Reusable `with` timer for one stage (one object per stage name, so no allocation per use)."""
+
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class LoopMetrics:
+    """
+    Per-stage latency and FPS counters for the live loop, cheap enough to leave on.
+
+    record()/stage() write a duration into a fixed-size ring buffer per
+    stage and count() stamps a rate counter; both are O(1) with no
+    allocation. Percentiles (p50/p95/p99) are only computed by snapshot(),
+    which the overlay and the exporters call at most every
+    `refresh_interval` / `export_interval` seconds.
+
+    Exports go to a JSON-lines file (one snapshot per line) and/or a
+    Prometheus textfile (node_exporter textfile collector format), both
+    optional. `labels` are added to every Prometheus sample, e.g.
+    {"booth": "1"}.
+    """
+
+    def __init__(self, window=300, jsonl_path=None, prom_path=None, export_interval=10.0,
+                 refresh_interval=0.5, labels=None):
+        self.window = window
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self.export_interval = export_interval
+        self.refresh_interval = refresh_interval
+        self.labels = dict(labels or {})
+        self._samples = {}     # stage -> [ring buffer (window,), next index, total count, total seconds]
+        self._stages = {}      # stage -> _Stage
+        self._counters = {}    # name -> deque of monotonic timestamps
+        self._snapshot = None
+        self._snapshot_time = 0.0
+        self._last_export = time.monotonic()
+        for path in (jsonl_path, prom_path):
+            if path and os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def stage(self, name):
+        """Context manager timing one stage: `with metrics.stage("inference"): ...`"""
+        timer = self._stages.get(name)
+        if timer is None:
+            timer = self._stages[name] = _Stage(self, name)
+        return timer
+
+    def record(self, name, seconds):
+        """Add one duration (seconds) for a stage, e.g. a latency measured on another thread."""
+        entry = self._samples.get(name)
+        if entry is None:
+            entry = self._samples[name] = [np.zeros(self.window, dtype=np.float64), 0, 0, 0.0]
+        entry[0][entry[1]] = seconds
+        entry[1] = (entry[1] + 1) % self.window
+        entry[2] += 1
+        entry[3] += float(seconds)
+
+    def count(self, name, now=None):
+        """Count one event (a frame captured, inferred, rendered) for an FPS counter."""
+        stamps = self._counters.get(name)
+        if stamps is None:
+            stamps = self._counters[name] = deque(maxlen=self.window)
+        stamps.append(time.monotonic() if now is None else now)
+
+    def fps(self, name):
+        stamps = self._counters.get(name)
+        if not stamps or len(stamps) < 2 or stamps[-1] <= stamps[0]:
+            return 0.0
+        return (len(stamps) - 1) / (stamps[-1] - stamps[0])
+
+    def snapshot(self):
+        """Dict with per-stage p50/p95/p99/mean in milliseconds plus counts, and FPS per counter."""
+        stages = {}
+        for name, (ring, _, total, total_seconds) in self._samples.items():
+            values = ring[:min(total, self.window)]
+            p = np.percentile(values, QUANTILES) * 1000
+            stages[name] = {"p50": float(p[0]), "p95": float(p[1]), "p99": float(p[2]),
+                            "mean": float(values.mean() * 1000), "count": total, "sum": total_seconds}
+        fps = {name: self.fps(name) for name in self._counters}
+        return {"time": time.time(), "stages": stages, "fps": fps}
+
+    def cached_snapshot(self):
+        """snapshot(), recomputed at most every refresh_interval seconds."""
+        now = time.monotonic()
+        if self._snapshot is None or now - self._snapshot_time >= self.refresh_interval:
+            self._snapshot = self.snapshot()
+            self._snapshot_time = now
+        return self._snapshot
+
+    def draw(self, frame, origin=(10, 20), scale=0.45, color=(0, 255, 255)):
+        """Overlay FPS and per-stage p50/p95 latency in the frame's corner (in place)."""
+        snap = self.cached_snapshot()
+        lines = ["FPS " + "  ".join(f"{name} {value:.1f}" for name, value in snap["fps"].items())]
+        for name, s in snap["stages"].items():
+            lines.append(f"{name:<10} p50 {s['p50']:6.1f}  p95 {s['p95']:6.1f} ms")
+        x, y = origin
+        for line in lines:
+            cv2.putText(frame, line, (x, y), cv2.FONT_HERSHEY_SIMPLEX, scale, color, 1, cv2.LINE_AA)
+            y += int(40 * scale)
+        return frame
+
+    def maybe_export(self, now=None):
+        """Write the exports if export_interval has passed; call once per loop iteration."""
+        if not (self.jsonl_path or self.prom_path):
+            return False
+        now = time.monotonic() if now is None else now
+        if now - self._last_export < self.export_interval:
+            return False
+        self._last_export = now
+        self.export()
+        return True
+
+    def flush(self):
+        """Write the configured exports now, whatever the interval (e.g. at shutdown)."""
+        if not (self.jsonl_path or self.prom_path):
+            return False
+        self._last_export = time.monotonic()
+        self.export()
+        return True
+
+    def export(self):
+        snap = self.snapshot()
+        if self.jsonl_path:
+            with open(self.jsonl_path, "a") as f:
+                f.write(json.dumps(dict(snap, labels=self.labels)) + "\n")
+        if self.prom_path:
+            # Write then rename, so the collector never reads a half-written file
+            tmp = self.prom_path + ".tmp"
+            with open(tmp, "w") as f:
+                f.write(self.prometheus_text(snap))
+            os.replace(tmp, self.prom_path)
+
+    def _labels(self, **extra):
+        labels = dict(self.labels, **extra)
+        return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+    def prometheus_text(self, snap=None):
+        snap = snap or self.snapshot()
+        lines = ["# HELP twinbros_stage_seconds Per-stage latency over the last samples of the live loop.",
+                 "# TYPE twinbros_stage_seconds summary"]
+        for name, s in snap["stages"].items():
+            for q in QUANTILES:
+                lines.append(f"twinbros_stage_seconds{self._labels(stage=name, quantile=q / 100)} "
+                             f"{s[f'p{q}'] / 1000:.6f}")
+            lines.append(f"twinbros_stage_seconds_sum{self._labels(stage=name)} {s['sum']:.6f}")
+            lines.append(f"twinbros_stage_seconds_count{self._labels(stage=name)} {s['count']}")
+        lines += ["# HELP twinbros_fps Events per second over the last samples.",
+                  "# TYPE twinbros_fps gauge"]
+        for name, value in snap["fps"].items():
+            lines.append(f"twinbros_fps{self._labels(loop=name)} {value:.3f}")
+        return "\n".join(lines) + "\n"
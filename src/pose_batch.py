@@ -0,0 +1,110 @@
+import cv2
+import numpy as np
+
+try:
+    from .pose_store import NUM_KEYPOINTS, normalize_batch
+except ImportError:
+    from pose_store import NUM_KEYPOINTS, normalize_batch
+
+_DISK_OFFSETS = {}
+
+
+def disk_offsets(radius):
+    """Offset (dy, dx) piksel dari lingkaran terisi cv2.circle dengan radius ini (di-cache)."""
+    offsets = _DISK_OFFSETS.get(radius)
+    if offsets is None:
+        size = 2 * radius + 1
+        patch = np.zeros((size, size), dtype=np.uint8)
+        cv2.circle(patch, (radius, radius), radius, 1, -1)
+        dy, dx = np.nonzero(patch)
+        offsets = _DISK_OFFSETS[radius] = (dy - radius, dx - radius)
+    return offsets
+
+
+class PoseBatch:
+    """
+    Hasil deteksi semua orang dalam satu frame: satu array (N, 17, 3) float32 berisi x, y, confidence.
+
+    Menggantikan list of list (x, y, conf). Iterasi tetap memberi satu
+    array (17, 3) per orang, jadi `for (x, y, conf) in person` masih jalan,
+    tapi jalur per frame memakai operasi batch: normalize() untuk matching
+    dan draw() untuk menggambar keypoint tanpa loop Python per titik.
+    """
+
+    __slots__ = ("data",)
+
+    def __init__(self, data=None):
+        if data is None:
+            data = np.zeros((0, NUM_KEYPOINTS, 3), dtype=np.float32)
+        self.data = np.asarray(data, dtype=np.float32).reshape(-1, NUM_KEYPOINTS, 3)
+
+    @classmethod
+    def from_keypoints(cls, keypoints):
+        """PoseBatch dari output get_keypoints apa pun (PoseBatch, list lama, array, atau None)."""
+        if isinstance(keypoints, cls):
+            return keypoints
+        if keypoints is None or len(keypoints) == 0:
+            return cls()
+        return cls(keypoints)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, i):
+        return self.data[i]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.data if dtype is None else self.data.astype(dtype, copy=False)
+
+    def __repr__(self):
+        return f"PoseBatch({len(self)} orang)"
+
+    @property
+    def xy(self):
+        return self.data[:, :, :2]
+
+    @property
+    def conf(self):
+        return self.data[:, :, 2]
+
+    def visible(self, conf_thresh=0.5):
+        return self.data[:, :, 2] > conf_thresh
+
+    def offset(self, x0, y0):
+        """
+        Geser ke koordinat frame penuh (mis. setelah deteksi di ROI); joint yang tidak terdeteksi tetap (0, 0).
+
+        Diputuskan per joint, bukan per koordinat: keypoint di-clip ke crop,
+        jadi joint asli di tepi kiri/atas crop (x == 0 atau y == 0) tetap
+        harus digeser.
+        """
+        data = self.data.copy()
+        valid = (data[:, :, 2] > 0) | (data[:, :, :2] != 0).any(axis=-1)
+        data[:, :, :2][valid] += np.array([x0, y0], dtype=np.float32)
+        return PoseBatch(data)
+
+    def normalize(self, conf_thresh=0.5):
+        """(poses (N, 17, 2), masks (N, 17)) ternormalisasi untuk semua orang sekaligus."""
+        return normalize_batch(self.xy, self.visible(conf_thresh))
+
+    def draw(self, frame, conf_thresh=0.5, radius=3, color=(0, 255, 0)):
+        """
+        Gambar semua keypoint yang terlihat sebagai titik terisi, langsung di frame (in place).
+
+        Satu disk offset di-stamp ke semua titik sekaligus dengan fancy
+        indexing; hasilnya sama dengan cv2.circle(..., radius, color, -1)
+        per titik.
+        """
+        pts = self.xy[self.visible(conf_thresh)]
+        if len(pts) == 0:
+            return frame
+        dy, dx = disk_offsets(radius)
+        ys = (pts[:, 1].astype(np.int32)[:, None] + dy).ravel()
+        xs = (pts[:, 0].astype(np.int32)[:, None] + dx).ravel()
+        h, w = frame.shape[:2]
+        inside = (ys >= 0) & (ys < h) & (xs >= 0) & (xs < w)
+        frame[ys[inside], xs[inside]] = color
+        return frame
@@ -1,10 +1,21 @@
 import cv2
+import time
+import threading
 import numpy as np
-from ultralytics import YOLO
+
+try:
+    from .pose_batch import PoseBatch
+    from .inference_backends import create_backend
+except ImportError:
+    from pose_batch import PoseBatch
+    from inference_backends import create_backend
 
 class PoseDetector:
-    def __init__(self, model_path="yolo11n-pose.pt", conf=0.5):
-        self.model = YOLO(model_path)
+    def __init__(self, model_path=None, conf=0.5, backend=None):
+        # backend: "ultralytics" / "onnx" / "openvino", default from TWINBROS_BACKEND
+        # (see inference_backends.py); model_path defaults per backend
+        self.backend = create_backend(backend, model_path)
+        self.model = self.backend.model   # ultralytics YOLO, None for exported backends
         self.conf = conf
 
     def normalize_pose(self, keypoints):
@@ -15,29 +26,47 @@ class PoseDetector:
             coords /= norm
         return coords
 
+    def normalize_people(self, keypoints, conf_thresh=0.5):
+        """
+        Normalisasi semua orang dari get_keypoints ke representasi 17 joint COCO.
+
+        Kembalikan (poses (N, 17, 2), masks (N, 17)); joint dengan confidence
+        di bawah conf_thresh di-mask, bukan dibuang, jadi indeks tetap sejajar
+        dengan pose referensi. Seluruh batch dihitung sekaligus (PoseBatch.normalize).
+        """
+        return PoseBatch.from_keypoints(keypoints).normalize(conf_thresh)
+
     def detect_poses(self, frame):
-        results = self.model(frame, conf=self.conf)
+        kps = self.backend.predict(frame, conf=self.conf)
         poses = []
 
-        for result in results:
-            if result.keypoints is not None and len(result.keypoints) > 0:
-                for kp in result.keypoints:
-                    coords = kp.xy.cpu().numpy().squeeze()
-                    norm_pose = self.normalize_pose(coords)
-                    poses.append(norm_pose)
+        if kps is not None:
+            for kp in kps:
+                norm_pose = self.normalize_pose(kp[:, :2].copy())
+                poses.append(norm_pose)
         return poses
 
-    def get_keypoints(self, frame):
-        # Mirroring the logic from Camera class
-        results = self.model.predict(source=frame, verbose=False)
-        keypoints = None
-        if len(results) > 0 and results[0].keypoints is not None:
-            kps = results[0].keypoints
-            xy = kps.xy.cpu().numpy()
-            conf = kps.conf.cpu().numpy()
-            keypoints = [list(zip(x[:, 0], x[:, 1], c)) for x, c in zip(xy, conf)]
+    def get_keypoints(self, frame, roi=None, imgsz=None):
+        # Returns a PoseBatch: (N, 17, 3) float32 x, y, confidence for every person
+        # roi=(x0, y0, x1, y1): detect only inside this crop (e.g. PoseTracker.roi),
+        # keypoints are returned in full-frame coordinates
+        # imgsz: YOLO input size for this call (see DetectionScheduler), default model size;
+        # ignored by exported models with a fixed input size
+        x0, y0 = 0, 0
+        if roi is not None:
+            x0, y0, x1, y1 = [int(v) for v in roi]
+            frame = frame[y0:y1, x0:x1]
+        keypoints = PoseBatch(self.backend.predict(frame, imgsz))
+        if x0 or y0:
+            keypoints = keypoints.offset(x0, y0)
         return keypoints
 
+    def get_keypoints_batch(self, frames, imgsz=None):
+        """get_keypoints for several full frames in one batched forward pass (e.g. one per booth)."""
+        if len(frames) == 0:
+            return []
+        return [PoseBatch(kps) for kps in self.backend.predict_batch(frames, imgsz)]
+
     def draw_poses(self, frame, results):
         annotated = frame.copy()
         for result in results:
@@ -46,6 +75,61 @@ class PoseDetector:
         return annotated
 
 
+class SharedPoseDetector:
+    """
+    PoseDetector that is safe to share between threads, Streamlit reruns and sessions.
+
+    ultralytics fuses Conv+BN layers lazily on the first predict; two threads
+    doing that at once is what raised `AttributeError: bn`. Here the model is
+    fused and warmed up once at construction, and predictions are serialized
+    with a lock. load_time and warmup_time are in seconds.
+    """
+
+    def __init__(self, model_path=None, conf=0.5, backend=None, warmup_shape=(480, 640, 3)):
+        start = time.perf_counter()
+        self.detector = PoseDetector(model_path, conf, backend)
+        self.detector.backend.prepare()
+        self.load_time = time.perf_counter() - start
+
+        self._lock = threading.Lock()
+
+        start = time.perf_counter()
+        self.get_keypoints(np.zeros(warmup_shape, dtype=np.uint8))
+        self.warmup_time = time.perf_counter() - start
+        print(f"[INFO] Pose model ready: load {self.load_time:.2f}s, warm-up {self.warmup_time:.2f}s")
+
+    @property
+    def model(self):
+        return self.detector.model
+
+    def normalize_pose(self, keypoints):
+        return self.detector.normalize_pose(keypoints)
+
+    def normalize_people(self, keypoints, conf_thresh=0.5):
+        return self.detector.normalize_people(keypoints, conf_thresh)
+
+    def get_keypoints(self, frame, roi=None, imgsz=None):
+        with self._lock:
+            return self.detector.get_keypoints(frame, roi, imgsz)
+
+    def get_keypoints_batch(self, frames, imgsz=None):
+        with self._lock:
+            return self.detector.get_keypoints_batch(frames, imgsz)
+
+
+_shared_detectors = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_detector(model_path=None, conf=0.5, backend=None):
+    """Return the process-wide SharedPoseDetector for this model, creating it on first use."""
+    with _shared_lock:
+        key = (model_path, conf, backend)
+        if key not in _shared_detectors:
+            _shared_detectors[key] = SharedPoseDetector(model_path, conf, backend)
+        return _shared_detectors[key]
+
+
 if __name__ == "__main__":
     detector = PoseDetector()
     cap = cv2.VideoCapture(0)
@@ -56,8 +140,11 @@ if __name__ == "__main__":
         if not ret:
             break
 
-        results = detector.model(frame)
-        annotated = detector.draw_poses(frame, results)
+        if detector.model is not None:
+            annotated = detector.draw_poses(frame, detector.model(frame))
+        else:
+            annotated = frame.copy()
+            detector.get_keypoints(frame).draw(annotated, radius=4)
 
         poses = detector.detect_poses(frame)
         cv2.putText(annotated, f"Detected poses: {len(poses)}",
@@ -0,0 +1,254 @@
+import os
+import zlib
+import time
+import argparse
+import numpy as np
+
+try:
+    from .pose_store import DEFAULT_STORE_PATH, load_library, normalize_keypoints, store_paths
+except ImportError:
+    from pose_store import DEFAULT_STORE_PATH, load_library, normalize_keypoints, store_paths
+
+INDEX_FORMAT_VERSION = 1
+
+# Di bawah ukuran ini brute force sudah cukup cepat, index tidak dibangun otomatis
+INDEX_MIN_POSES = 5000
+
+
+def index_path(store_path=DEFAULT_STORE_PATH):
+    """Path file index (.index.npz) di sebelah library pose."""
+    array_path, _ = store_paths(store_path)
+    return os.path.splitext(array_path)[0] + ".index.npz"
+
+
+def library_fingerprint(array):
+    """CRC32 array library, supaya index lama tidak dipakai untuk library baru."""
+    return zlib.crc32(np.ascontiguousarray(array)) & 0xFFFFFFFF
+
+
+def unique_rows(rows, size):
+    """Baris unik terurut lewat bitmap; jauh lebih cepat dari np.unique untuk index int besar."""
+    flags = np.zeros(size, dtype=bool)
+    flags[rows] = True
+    return np.flatnonzero(flags)
+
+
+def _sq_distances(x, centroids):
+    """Jarak kuadrat (N, K) antara baris x dan centroid."""
+    d = (x ** 2).sum(axis=1)[:, None] - 2 * x @ centroids.T + (centroids ** 2).sum(axis=1)[None, :]
+    return np.maximum(d, 0)
+
+
+def _kmeans(x, k, iters=20, seed=0, chunk=16384):
+    """K-means (Lloyd) sederhana di numpy: kembalikan (centroids (k, d), assign (N,))."""
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    assign = np.zeros(len(x), dtype=np.int64)
+    for _ in range(iters):
+        for start in range(0, len(x), chunk):
+            assign[start:start + chunk] = np.argmin(_sq_distances(x[start:start + chunk], centroids), axis=1)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Cluster kosong diisi ulang dengan titik acak
+        if empty.any():
+            centroids[empty] = x[rng.choice(len(x), size=int(empty.sum()), replace=False)]
+    return centroids, assign
+
+
+def _masked_projection(mean, components, poses, masks, chunk=8192):
+    """
+    Koefisien PCA (N, d) dari joint yang terlihat saja.
+
+    Joint tersembunyi tidak dianggap nol: koefisien dipilih supaya
+    rekonstruksi PCA paling dekat dengan joint yang terlihat (least squares
+    per pose), sehingga pose dengan joint hilang tetap jatuh di dekat pose
+    lengkap yang mirip.
+    """
+    poses = np.asarray(poses, dtype=np.float32).reshape(len(poses), -1, 2)
+    masks = np.asarray(masks, dtype=np.float32).reshape(len(poses), -1)
+    d = len(components)
+    out = np.zeros((len(poses), d), dtype=np.float32)
+    for start in range(0, len(poses), chunk):
+        m = np.repeat(masks[start:start + chunk], 2, axis=1)                    # (n, 34)
+        x = poses[start:start + chunk].reshape(len(m), -1) - mean
+        a = np.einsum("kd,nd,ld->nkl", components, m, components) + 1e-4 * np.eye(d)
+        b = (m * x) @ components.T
+        out[start:start + chunk] = np.linalg.solve(a, b[:, :, None])[:, :, 0]
+    return out
+
+
+class PoseIndex:
+    """
+    Index IVF di ruang PCA untuk library pose besar (100k+ pose).
+
+    Setiap pose (17 x 2, sudah dinormalisasi) diproyeksikan ke n_components
+    komponen PCA hanya dari joint yang terlihat (least squares, lihat
+    project), lalu dikelompokkan dengan k-means ke n_lists cluster.
+    Pencarian hanya membuka nprobe cluster terdekat, mengambil n_candidates
+    pose terdekat di ruang PCA, dan skor akhirnya dihitung ulang secara
+    eksak oleh PoseMatcher.
+    """
+
+    def __init__(self, mean, components, centroids, offsets, rows, projected,
+                 fingerprint=None, nprobe=None, n_candidates=4096):
+        self.mean = mean
+        self.components = components
+        self.centroids = centroids
+        self.offsets = offsets          # (L + 1,) awal tiap cluster di rows/projected
+        self.rows = rows                # (M,) baris library, diurutkan per cluster
+        self.projected = projected      # (M, d) proyeksi PCA, urutan sama dengan rows
+        self.sq_norms = (projected ** 2).sum(axis=1)
+        self.fingerprint = fingerprint
+        self.nprobe = nprobe or max(1, len(centroids) // 8)
+        self.n_candidates = n_candidates
+
+    def __len__(self):
+        return len(self.rows)
+
+    @classmethod
+    def build(cls, poses, masks, n_components=12, n_lists=None, iters=20, seed=0, fingerprint=None):
+        """Bangun index dari pose (M, 17, 2) dan mask (M, 17) library."""
+        poses = np.asarray(poses, dtype=np.float32)
+        masks = np.asarray(masks, dtype=np.float32)
+        x = (poses * masks[:, :, None]).reshape(len(poses), -1)
+        # PCA dari pose yang lengkap kalau jumlahnya cukup (joint kosong = 0 merusak kovarians)
+        complete = masks.all(axis=1)
+        fit = x[complete] if complete.sum() > 4 * x.shape[1] else x
+        mean = fit.mean(axis=0)
+        centered = fit - mean
+        # Eigen-decomposition kovarians (34 x 34), murah untuk M besar
+        _, eigvecs = np.linalg.eigh(centered.T @ centered / max(len(fit) - 1, 1))
+        n_components = min(n_components, x.shape[1])
+        components = np.ascontiguousarray(eigvecs[:, ::-1][:, :n_components].T, dtype=np.float32)
+
+        projected = _masked_projection(mean, components, poses, masks)
+        n_lists = min(n_lists or max(1, int(np.sqrt(len(x)))), len(x))
+        centroids, assign = _kmeans(projected, n_lists, iters=iters, seed=seed)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))])
+        return cls(mean, components, centroids.astype(np.float32), offsets.astype(np.int64),
+                   order.astype(np.int64), np.ascontiguousarray(projected[order]), fingerprint)
+
+    def project(self, poses, masks):
+        """Koefisien PCA (N, d) pose dari joint yang terlihat saja (lihat _masked_projection)."""
+        return _masked_projection(self.mean, self.components, poses, masks)
+
+    def search(self, poses, masks, nprobe=None, n_candidates=None):
+        """Baris library kandidat (unik, terurut) untuk query pose (Q, 17, 2) dan mask (Q, 17)."""
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        n_candidates = n_candidates or self.n_candidates
+        q = self.project(poses, masks)
+        probe = np.argpartition(_sq_distances(q, self.centroids), nprobe - 1, axis=1)[:, :nprobe]
+
+        found = []
+        for i in range(len(q)):
+            idx = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in probe[i]])
+            if len(idx) > n_candidates:
+                # |p - q|^2 tanpa suku |q|^2 (sama untuk semua kandidat)
+                d = self.sq_norms[idx] - 2 * (self.projected[idx] @ q[i])
+                idx = idx[np.argpartition(d, n_candidates - 1)[:n_candidates]]
+            found.append(self.rows[idx])
+        return unique_rows(np.concatenate(found), len(self.rows)) if found else np.zeros(0, dtype=np.int64)
+
+    def save(self, path):
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, version=INDEX_FORMAT_VERSION, mean=self.mean, components=self.components,
+                 centroids=self.centroids, offsets=self.offsets, rows=self.rows,
+                 projected=self.projected, fingerprint=np.int64(self.fingerprint or 0),
+                 nprobe=self.nprobe, n_candidates=self.n_candidates)
+        os.replace(tmp, path)
+        print(f"[INFO] Pose index disimpan: {path} ({len(self.centroids)} cluster, {len(self)} pose)")
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if int(data["version"]) != INDEX_FORMAT_VERSION:
+                raise RuntimeError(f"Format index {path} versi {int(data['version'])} tidak didukung")
+            return cls(data["mean"], data["components"], data["centroids"], data["offsets"],
+                       data["rows"], data["projected"], int(data["fingerprint"]),
+                       int(data["nprobe"]), int(data["n_candidates"]))
+
+
+def sample_queries(poses, masks, n=200, noise=0.03, drop=0.1, seed=0):
+    """Query uji: pose library acak + noise + sebagian joint dibuang, lalu dinormalisasi ulang."""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(poses), size=min(n, len(poses)), replace=False)
+    queries = np.zeros((len(rows), poses.shape[1], 2), dtype=np.float32)
+    query_masks = np.zeros((len(rows), poses.shape[1]), dtype=np.float32)
+    for i, row in enumerate(rows):
+        mask = (np.asarray(masks[row]) > 0) & (rng.random(poses.shape[1]) > drop)
+        xy = np.asarray(poses[row]) + rng.normal(scale=noise, size=(poses.shape[1], 2))
+        queries[i], query_masks[i] = normalize_keypoints(xy, mask)
+    return queries, query_masks
+
+
+def evaluate_recall(matcher, queries, masks, k=5):
+    """
+    Recall@k index terhadap brute force: rata-rata |topk_index & topk_exact| / k.
+
+    Kembalikan dict dengan recall serta rata-rata waktu per query (ms) untuk
+    brute force dan index.
+    """
+    hits, brute_time, index_time = 0, 0.0, 0.0
+    k = min(k, len(matcher.names))
+    for pose, mask in zip(queries, masks):
+        t0 = time.perf_counter()
+        exact = matcher.score_matrix(pose[None], mask[None], use_index=False)[0]
+        t1 = time.perf_counter()
+        approx = matcher.score_matrix(pose[None], mask[None])[0]
+        t2 = time.perf_counter()
+        brute_time += t1 - t0
+        index_time += t2 - t1
+        top_exact = np.argpartition(-exact, k - 1)[:k]
+        top_approx = np.argpartition(-approx, k - 1)[:k]
+        hits += len(np.intersect1d(top_exact, top_approx))
+    n = max(len(queries), 1)
+    return {"k": k, "recall": hits / (n * k),
+            "brute_ms": brute_time / n * 1000, "index_ms": index_time / n * 1000}
+
+
+def build_index(store_path=DEFAULT_STORE_PATH, n_components=12, n_lists=None, nprobe=None,
+                n_candidates=4096, report=True):
+    """Bangun index untuk library di store_path, simpan di sebelahnya, dan laporkan recall@k."""
+    array, _ = load_library(store_path, mmap=True)
+    poses, masks = array[:, :, :2], array[:, :, 2]
+    t0 = time.perf_counter()
+    index = PoseIndex.build(poses, masks, n_components=n_components, n_lists=n_lists,
+                            fingerprint=library_fingerprint(array))
+    if nprobe:
+        index.nprobe = nprobe
+    index.n_candidates = n_candidates
+    print(f"[INFO] Pose index dibangun dalam {time.perf_counter() - t0:.1f}s")
+    path = index_path(store_path)
+    index.save(path)
+
+    if report:
+        try:
+            from .pose_matching import PoseMatcher
+        except ImportError:
+            from pose_matching import PoseMatcher
+        # Scoring yang benar-benar memakai index (cosine selalu brute force)
+        matcher = PoseMatcher(store_path=store_path, scoring="procrustes")
+        queries, query_masks = sample_queries(poses, masks)
+        for k in (1, 5, 10):
+            r = evaluate_recall(matcher, queries, query_masks, k=k)
+            print(f"[INFO] recall@{k}: {r['recall']:.3f} "
+                  f"(brute force {r['brute_ms']:.2f} ms, index {r['index_ms']:.2f} ms per query)")
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a PCA + IVF index next to the reference pose library.")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH,
+                        help="Path library pose tanpa ekstensi (default: data/reference_library)")
+    parser.add_argument("--components", type=int, default=12, help="Jumlah komponen PCA (default: 12)")
+    parser.add_argument("--lists", type=int, default=None, help="Jumlah cluster IVF (default: sqrt(M))")
+    parser.add_argument("--nprobe", type=int, default=None, help="Cluster yang dibuka per query (default: lists/8)")
+    parser.add_argument("--candidates", type=int, default=4096,
+                        help="Kandidat yang di-rerank secara eksak per query (default: 4096)")
+    args = parser.parse_args()
+
+    build_index(args.store, args.components, args.lists, args.nprobe, args.candidates)
@@ -2,46 +2,326 @@ import os
 import json
 import numpy as np
 
+try:
+    from .pose_store import NUM_KEYPOINTS, load_library, normalize_keypoints, store_exists
+    from .pose_index import PoseIndex, index_path, library_fingerprint
+except ImportError:
+    from pose_store import NUM_KEYPOINTS, load_library, normalize_keypoints, store_exists
+    from pose_index import PoseIndex, index_path, library_fingerprint
+
+# Indeks joint COCO setelah dicerminkan (kiri <-> kanan)
+COCO_FLIP = np.array([0, 2, 1, 4, 3, 6, 5, 8, 7, 10, 9, 12, 11, 14, 13, 16, 15])
+
+# Minimal joint yang terlihat di kedua pose supaya alignment Procrustes bermakna
+MIN_SHARED_JOINTS = 3
+
 class PoseMatcher:
-    
-    def __init__(self, base_dir=None):
-      if base_dir is None:
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def __init__(self, base_dir=None, store_path=None, joint_weights=None,
+                 scoring="cosine", allow_scale=True, allow_mirror=True, use_index=True):
+        if scoring not in ("cosine", "procrustes"):
+            raise ValueError(f"Unknown scoring: {scoring}")
+        # "procrustes": skor setelah rotasi optimal (opsional skala & cermin),
+        # jadi badan yang sedikit miring atau pose yang dicerminkan tetap cocok.
+        self.scoring = scoring
+        self.allow_scale = allow_scale
+        self.allow_mirror = allow_mirror
+
+        if base_dir is None:
+            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.reference_dir = os.path.join(base_dir, "data", "reference_poses")
-        self.references = self._load_reference_poses()
+        self.store_path = store_path or os.path.join(base_dir, "data", "reference_library")
+
+        # Bobot per joint COCO (mis. naikkan bobot pergelangan tangan untuk pose tangan)
+        if joint_weights is None:
+            joint_weights = np.ones(NUM_KEYPOINTS, dtype=np.float32)
+        self.joint_weights = np.asarray(joint_weights, dtype=np.float32)
+
+        # Index PCA + IVF opsional (dibangun oleh pose_preprocessing untuk library besar)
+        self.index = None
+        if store_exists(self.store_path):
+            self.names, poses, masks = self._load_library(use_index)
+        else:
+            self.names, poses, masks = self._load_reference_poses()
+        self._build_features(poses, masks)
+
+    def _load_library(self, use_index=True):
+        """Buka library biner dengan mmap: satu file, tanpa parse JSON per pose."""
+        array, manifest = load_library(self.store_path, mmap=True)
+        names = np.array([e["name"] for e in manifest["entries"]])
+        print(f"[INFO] Loaded {len(names)} reference poses from {self.store_path}")
+        # Index hanya untuk procrustes (juga jalur kandidat DuoMatcher); cosine brute force
+        # sudah secepat pencarian index dan tetap eksak (recall 1.0)
+        if use_index and self.scoring == "procrustes":
+            self.index = self._load_index(array)
+        return names, array[:, :, :2], array[:, :, 2]
+
+    def _load_index(self, array):
+        path = index_path(self.store_path)
+        if not os.path.exists(path):
+            return None
+        try:
+            index = PoseIndex.load(path)
+        except Exception as e:
+            print(f"[WARNING] Gagal membaca pose index {path}: {e}")
+            return None
+        if index.fingerprint != library_fingerprint(array):
+            print(f"[WARNING] Pose index {path} tidak cocok dengan library, pakai brute force. "
+                  "Jalankan ulang pose_preprocessing.")
+            return None
+        print(f"[INFO] Using pose index {path} ({len(index.centroids)} clusters, nprobe {index.nprobe})")
+        return index
 
-    
     def _load_reference_poses(self):
-        references = {}
-        for file in os.listdir(self.reference_dir):
+        """Muat semua pose referensi dari folder JSON lama ke representasi 17 joint + mask."""
+        names, poses, masks = [], [], []
+        for file in sorted(os.listdir(self.reference_dir)):
             if file.endswith(".json"):
                 path = os.path.join(self.reference_dir, file)
                 with open(path, "r") as f:
-                    data = np.array(json.load(f))
-                    references[file] = data
-        print(f"[INFO] Loaded {len(references)} reference poses from {self.reference_dir}")
-        return references
+                    pose = np.asarray(json.load(f), dtype=np.float32).reshape(-1, 2)
+                # JSON lama: titik kosong sudah dibuang, jadi titik yang ada dianggap joint pertama
+                pose, mask = normalize_keypoints(pose, np.arange(NUM_KEYPOINTS) < len(pose))
+                poses.append(pose)
+                masks.append(mask)
+                names.append(os.path.splitext(file)[0])
+        print(f"[INFO] Loaded {len(names)} reference poses from {self.reference_dir}")
+        poses = np.array(poses, dtype=np.float32).reshape(-1, NUM_KEYPOINTS, 2)
+        masks = np.array(masks, dtype=np.float32).reshape(-1, NUM_KEYPOINTS)
+        return np.array(names), poses, masks
+
+    def _build_features(self, poses, masks):
+        # Matriks kontigu per referensi (M baris):
+        #   coords  (M, 34): x, y tiap joint, nol kalau joint tidak terlihat
+        #   sq      (M, 17): |r_j|^2 tiap joint
+        #   masks   (M, 17): 1 kalau joint terlihat
+        # Untuk brute force cosine, norma referensi atas semua joint-nya
+        # (ref_norm) dan daftar baris yang joint-nya tersembunyi disiapkan di
+        # sini, jadi per query hanya coords yang dibaca penuh (lihat
+        # cosine_matrix).
+        m = len(poses)
+        masks = np.ascontiguousarray(masks, dtype=np.float32)
+        poses = np.asarray(poses, dtype=np.float32) * masks[:, :, None]
+        self.poses = poses
+        self.masks = masks
+        self.coords = np.ascontiguousarray(poses.reshape(m, NUM_KEYPOINTS * 2))
+        self.sq = np.ascontiguousarray((poses ** 2).sum(axis=2))
+        self.sq_t = np.ascontiguousarray(self.sq.T)                  # (17, M): satu baris per joint
+        self.ref_norm = self.sq @ self.joint_weights                 # (M,) sum_j w_j |r_j|^2
+        # (joint, baris referensi yang joint itu tidak terlihat), hanya joint yang pernah hilang
+        self.hidden = [(j, np.flatnonzero(masks[:, j] == 0)) for j in range(NUM_KEYPOINTS)]
+        self.hidden = [(j, rows) for j, rows in self.hidden if len(rows)]
+        # Koordinat x dan y terpisah untuk cross-covariance Procrustes
+        self.rx = np.ascontiguousarray(poses[:, :, 0])
+        self.ry = np.ascontiguousarray(poses[:, :, 1])
 
     def _cosine_similarity(self, a, b):
         """Hitung kesamaan antara dua pose dengan cosine similarity."""
-        a = a.flatten()
-        b = b.flatten()
-        a /= np.linalg.norm(a) + 1e-8
-        b /= np.linalg.norm(b) + 1e-8
+        a = np.asarray(a, dtype=np.float32).flatten()
+        b = np.asarray(b, dtype=np.float32).flatten()
+        a = a / (np.linalg.norm(a) + 1e-8)
+        b = b / (np.linalg.norm(b) + 1e-8)
         return np.dot(a, b)
 
-   
-    def match(self, user_pose):
-        
-        if not self.references:
-            raise RuntimeError("Tidak ada pose referensi yang dimuat!")
+    def _user_arrays(self, user_poses, user_masks=None):
+        """Ubah pose user menjadi array (N, 17, 2) dan mask (N, 17) float32."""
+        if isinstance(user_poses, np.ndarray) and user_poses.shape[1:] == (NUM_KEYPOINTS, 2):
+            users = user_poses.astype(np.float32, copy=False)
+        else:
+            users = np.zeros((len(user_poses), NUM_KEYPOINTS, 2), dtype=np.float32)
+            for i, user_pose in enumerate(user_poses):
+                pose = np.asarray(user_pose, dtype=np.float32).reshape(-1, 2)[:NUM_KEYPOINTS]
+                users[i, :len(pose)] = pose
+        if user_masks is None:
+            masks = (~np.all(users == 0, axis=2)).astype(np.float32)
+        else:
+            masks = np.asarray(user_masks, dtype=np.float32).reshape(len(users), NUM_KEYPOINTS)
+        return users, masks
+
+    def candidate_rows(self, user_poses, user_masks=None):
+        """Baris referensi kandidat dari index untuk pose user (None kalau tidak ada index)."""
+        if self.index is None:
+            return None
+        users, masks = self._user_arrays(user_poses, user_masks)
+        if self.scoring == "procrustes" and self.allow_mirror:
+            users = np.concatenate([users, users[:, COCO_FLIP] * np.array([-1.0, 1.0], dtype=np.float32)])
+            masks = np.concatenate([masks, masks[:, COCO_FLIP]])
+        return self.index.search(users, masks)
+
+    def _rows(self, rows, *arrays):
+        return arrays if rows is None else [np.take(a, rows, axis=0) for a in arrays]
+
+    def score_matrix(self, user_poses, user_masks=None, rows=None, use_index=True):
+        """
+        Skor N pose user terhadap semua M referensi: array (N, M).
+
+        rows: hanya hitung baris referensi ini, baris lain bernilai -inf.
+        Kalau rows None dan ada index, kandidat diambil dari index lalu
+        di-rerank secara eksak; use_index=False memaksa brute force.
+        """
+        users, masks = self._user_arrays(user_poses, user_masks)
+        if rows is None and use_index:
+            rows = self.candidate_rows(users, masks)
+        if rows is None:
+            return self.score_rows(users, masks)
+
+        scores = np.full((len(users), len(self.names)), -np.inf, dtype=np.float32)
+        if len(rows):
+            scores[:, rows] = self.score_rows(users, masks, rows)
+        return scores
+
+    def score_rows(self, user_poses, user_masks=None, rows=None):
+        """Skor eksak (N, len(rows)) terhadap baris referensi `rows` saja (None = semua), tanpa index."""
+        users, masks = self._user_arrays(user_poses, user_masks)
+        if self.scoring == "procrustes":
+            return self.procrustes_matrix(users, masks, rows)
+        return self.cosine_matrix(users, masks, rows)
+
+    def cosine_matrix(self, user_poses, user_masks=None, rows=None):
+        """
+        Masked cosine similarity N pose user terhadap referensi (semua, atau `rows`).
+
+        Hanya joint yang terlihat di kedua pose yang dihitung, masing-masing
+        dengan bobot joint_weights:
+            sum_j w_j <u_j, r_j> / sqrt(sum_j w_j |u_j|^2 * sum_j w_j |r_j|^2)
 
-        best_name, best_score = None, -1
+        Brute force (rows None) hanya membaca coords satu kali: kedua norma
+        diturunkan dari ref_norm dan total norma user, dikoreksi untuk joint
+        yang tidak terlihat (baris sq_t untuk joint user yang hilang, daftar
+        `hidden` untuk joint referensi yang hilang). Dengan library yang
+        jointnya lengkap biayanya hampir sama dengan cosine biasa
+        (coords @ q); makin banyak joint hilang, makin banyak koreksinya.
+        """
+        users, masks = self._user_arrays(user_poses, user_masks)
+        if rows is not None:
+            return self._cosine_rows(users, masks, rows)
+
+        n = len(users)
+        wu = self.joint_weights[None, :] * masks                     # (N, 17)
+        q_dots = (users * wu[:, :, None]).reshape(n, -1).T            # (34, N)
+        a = wu * (users ** 2).sum(axis=2)                             # (N, 17) w_j |u_j|^2
+        missing = self.joint_weights[None, :] * (1 - masks)          # (N, 17) bobot joint user yang hilang
+        if n == 1:
+            # Matriks-vektor (gemv) jauh lebih cepat daripada gemm dengan 1 kolom
+            q_dots, a, missing = q_dots[:, 0], a[0], missing[0]
+            gone = np.flatnonzero(missing)
+        else:
+            gone = np.flatnonzero(missing.any(axis=0))
+
+        dots = self.coords @ q_dots                                   # (M,) atau (M, N)
+        ref_sq = self.ref_norm if n == 1 else self.ref_norm[:, None]
+        if len(gone):
+            ref_sq = ref_sq - self.sq_t[gone].T @ missing[..., gone].T
+        user_sq = a.sum(axis=-1)                                      # skalar atau (N,)
+        if self.hidden:
+            user_sq = np.broadcast_to(user_sq, dots.shape).copy()
+            for j, hidden_rows in self.hidden:
+                user_sq[hidden_rows] -= a[..., j]
+        scores = dots / (np.sqrt(np.maximum(ref_sq * user_sq, 0)) + 1e-8)
+        return scores.reshape(len(self.coords), n).T
+
+    def _cosine_rows(self, users, masks, rows):
+        """cosine_matrix untuk subset baris (kandidat index): tiga perkalian pada baris yang diambil."""
+        ref_coords, ref_sq, ref_masks = self._rows(rows, self.coords, self.sq, self.masks)
+
+        n = len(users)
+        wu = self.joint_weights[None, :] * masks                     # (N, 17)
+
+        q_dots = (users * wu[:, :, None]).reshape(n, -1).T            # (34, N)
+        q_user = (wu * (users ** 2).sum(axis=2)).T                    # (17, N)
+        if n == 1:
+            # Matriks-vektor (gemv) jauh lebih cepat daripada gemm dengan 1 kolom
+            q_dots, q_user, q_ref = q_dots[:, 0], q_user[:, 0], wu[0]
+        else:
+            q_ref = wu.T
+
+        dots = ref_coords @ q_dots
+        ref_sq = ref_sq @ q_ref
+        user_sq = ref_masks @ q_user
+        scores = dots / (np.sqrt(np.maximum(ref_sq * user_sq, 0)) + 1e-8)
+        return scores.reshape(len(ref_coords), n).T
+
+    def procrustes_matrix(self, user_poses, user_masks=None, rows=None):
+        """
+        Skor Procrustes N pose user terhadap referensi (semua, atau `rows`): array (N, M).
+
+        Untuk tiap pasangan, kedua pose dipusatkan pada joint yang terlihat di
+        keduanya, lalu referensi diputar secara optimal ke pose user (orthogonal
+        Procrustes). Semua jumlah berbobot dihitung lewat perkalian matriks
+        untuk seluruh library sekaligus; "SVD" 2x2 per pasangan diselesaikan
+        dalam bentuk tertutup: jumlah singular value dengan det > 0 adalah
+        sqrt((Hxx + Hyy)^2 + (Hxy - Hyx)^2).
+
+        allow_scale: skor = korelasi setelah rotasi (invarian skala).
+        Tanpa skala: skor = 1 - residual / 2 pada pose yang sudah unit norm.
+        allow_mirror: pose user juga dicocokkan dalam versi cermin (x -> -x
+        dan joint kiri/kanan ditukar), diambil skor terbaik. Kamera membalik
+        frame secara horizontal, gambar referensi tidak.
+        """
+        users, masks = self._user_arrays(user_poses, user_masks)
+        ref_x, ref_y, ref_masks, ref_sq = self._rows(rows, self.rx, self.ry, self.masks, self.sq)
+        n = len(users)
+        if self.allow_mirror:
+            # Mencerminkan query setara dengan mencerminkan semua referensi,
+            # tanpa perlu menyimpan salinan cermin library.
+            mirrored = users[:, COCO_FLIP] * np.array([-1.0, 1.0], dtype=np.float32)
+            users = np.concatenate([users, mirrored])
+            masks = np.concatenate([masks, masks[:, COCO_FLIP]])
+
+        q = len(users)
+        wu = self.joint_weights[None, :] * masks                     # (Q, 17)
+        ux, uy = users[:, :, 0], users[:, :, 1]
+        # Blok query: [w*ux ; w*uy ; w ; w*|u|^2 ; mask], masing-masing (Q, 17)
+        query = np.concatenate([wu * ux, wu * uy, wu, wu * (ux ** 2 + uy ** 2), masks])
+
+        # Hasil (5Q, M): tiap blok baris kontigu, jadi operasi elementwise di bawah cepat
+        rx = query @ ref_x.T
+        ry = query @ ref_y.T
+        rm = query @ ref_masks.T
+        ref_sq = wu @ ref_sq.T                                       # (Q, M)
+
+        b = lambda a, i: a[i * q:(i + 1) * q]
+        c = np.maximum(b(rm, 2), 1e-8)                               # total bobot joint bersama
+        srx, sry = b(rx, 2), b(ry, 2)                                # sum w*r
+        sux, suy = b(rm, 0), b(rm, 1)                                # sum w*u (pada joint bersama)
+
+        # Cross-covariance H = sum w (r - r_mean)(u - u_mean)^T
+        hxx = b(rx, 0) - srx * sux / c
+        hxy = b(rx, 1) - srx * suy / c
+        hyx = b(ry, 0) - sry * sux / c
+        hyy = b(ry, 1) - sry * suy / c
+        ref_norm = np.maximum(ref_sq - (srx ** 2 + sry ** 2) / c, 0)
+        user_norm = np.maximum(b(rm, 3) - (sux ** 2 + suy ** 2) / c, 0)
+
+        trace = np.sqrt((hxx + hyy) ** 2 + (hxy - hyx) ** 2)
+        if self.allow_scale:
+            scores = trace / (np.sqrt(ref_norm * user_norm) + 1e-8)
+        else:
+            scores = 1 - (ref_norm + user_norm - 2 * trace) / 2
+        scores = np.where(b(rm, 4) >= MIN_SHARED_JOINTS, scores, -1.0)
+
+        if self.allow_mirror:
+            scores = np.maximum(scores[:n], scores[n:])
+        return scores
+
+    def _scores(self, user_pose, user_mask=None):
+        """Masked cosine similarity satu pose user terhadap semua referensi sekaligus."""
+        return self.score_matrix([user_pose], None if user_mask is None else [user_mask])[0]
+
+    def match_topk(self, user_pose, k=5, user_mask=None):
+        """Kembalikan k referensi terbaik sebagai list (name, score), urut dari skor tertinggi."""
+        if len(self.names) == 0:
+            raise RuntimeError("Tidak ada pose referensi yang dimuat!")
 
-        for name, ref_pose in self.references.items():
-            n = min(len(user_pose), len(ref_pose))
-            score = self._cosine_similarity(np.array(user_pose[:n]), ref_pose[:n])
-            if score > best_score:
-                best_name, best_score = name, score
+        scores = self._scores(user_pose, user_mask)
+        k = min(k, len(scores))
+        if k == 1:
+            # match(): satu argmax, tanpa partisi seluruh library
+            top = [int(np.argmax(scores))]
+        else:
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+        return [(str(self.names[i]), float(scores[i])) for i in top]
 
-        return best_name, best_score
+    def match(self, user_pose, user_mask=None):
+        return self.match_topk(user_pose, k=1, user_mask=user_mask)[0]
@@ -1,23 +1,48 @@
 import os
 import cv2
 import json
+import hashlib
+import argparse
 import numpy as np
-from ultralytics import YOLO
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    from .pose_store import (DEFAULT_STORE_PATH, NORMALIZATION_VERSION, normalize_keypoints,
+                             save_library, store_exists)
+    from .pose_index import INDEX_MIN_POSES, build_index, index_path
+except ImportError:
+    from pose_store import (DEFAULT_STORE_PATH, NORMALIZATION_VERSION, normalize_keypoints,
+                            save_library, store_exists)
+    from pose_index import INDEX_MIN_POSES, build_index, index_path
 
 # === PATH SETUP ===
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 ICONIC_DIR = os.path.join(BASE_DIR, "data", "iconic_images")
 OUTPUT_DIR = os.path.join(BASE_DIR, "data", "reference_poses")
 VISUAL_DIR = os.path.join(BASE_DIR, "data", "pose_visualizations")
+CACHE_PATH = os.path.join(BASE_DIR, "data", "reference_build_cache.json")
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs(VISUAL_DIR, exist_ok=True)
 
+MODEL_PATH = "yolo11n-pose.pt"  # Updated to YOLO11
+TARGET_SIZE = (640, 480)
+
 # === YOLOv8 Pose Model ===
-model = YOLO("yolo11n-pose.pt")  # Updated to YOLO11
+# Dimuat saat pertama dibutuhkan, supaya run tanpa gambar baru tidak perlu load YOLO.
+_model = None
+
+
+def get_model():
+    global _model
+    if _model is None:
+        # Lazy import: worker decode di process pool tidak perlu memuat ultralytics
+        from ultralytics import YOLO
+        _model = YOLO(MODEL_PATH)
+    return _model
 
 
-def resize_and_pad(image, target_size=(640, 480)):
+def resize_and_pad(image, target_size=TARGET_SIZE):
     """Resize gambar tanpa merusak rasio aslinya dan beri padding hitam."""
     h, w = image.shape[:2]
     target_w, target_h = target_size
@@ -33,94 +58,306 @@ def resize_and_pad(image, target_size=(640, 480)):
 
 
 def normalize_pose(keypoints):
-    """Normalisasi koordinat pose agar konsisten antar gambar."""
-    coords = np.array(keypoints)
-    coords = coords[~np.all(coords == 0, axis=1)]  # hapus titik kosong
+    """
+    Normalisasi koordinat pose agar konsisten antar gambar.
 
-    if len(coords) == 0:
+    Tetap 17 titik sejajar indeks COCO: titik kosong (0, 0) tidak dibuang
+    lagi, tapi dibuat nol dan ditandai oleh keypoint_mask.
+    """
+    pose, mask = normalize_keypoints(keypoints)
+    if not mask.any():
         return None
+    return pose.tolist()
 
-    coords -= coords.mean(axis=0)  # pusatkan
-    body_height = coords[:, 1].max() - coords[:, 1].min()
-    if body_height > 0:
-        coords /= body_height
 
-    norm = np.linalg.norm(coords)
-    if norm != 0:
-        coords /= norm
+def keypoint_mask(keypoints):
+    """Mask 17 keypoint COCO: True untuk titik yang terdeteksi (bukan (0, 0))."""
+    return (~np.all(np.asarray(keypoints) == 0, axis=1)).tolist()
 
-    return coords.tolist()
 
-
-def extract_pose_from_image(image_path):
-    """Deteksi semua pose manusia pada gambar dan kembalikan (poses, vis_image)."""
+def load_image(image_path):
+    """Baca dan resize_and_pad satu gambar. Dijalankan di process pool; None kalau gagal."""
     image = cv2.imread(image_path)
     if image is None:
-        print(f"[WARNING] Gagal membaca gambar: {image_path}")
-        return [], None
+        return None
+    return resize_and_pad(image)
+
 
-    image = resize_and_pad(image)
-    results = model(image, verbose=False)
-    vis = image.copy()
+def poses_from_result(result, image, draw=True):
+    """Ambil (poses, masks, vis_image) dari satu hasil YOLO untuk gambar yang sudah di-resize."""
+    vis = image.copy() if draw else None
     all_poses = []
+    all_masks = []
 
-    for result in results:
-        if result.keypoints is None:
-            continue
+    if result.keypoints is None:
+        return all_poses, all_masks, vis
 
-        for pid, keypoints in enumerate(result.keypoints.xy):
-            keypoints = keypoints.cpu().numpy()
-            norm_pose = normalize_pose(keypoints)
+    for pid, keypoints in enumerate(result.keypoints.xy):
+        keypoints = keypoints.cpu().numpy()
+        norm_pose = normalize_pose(keypoints)
 
-            if norm_pose is not None:
-                all_poses.append(norm_pose)
+        if norm_pose is not None:
+            all_poses.append(norm_pose)
+            all_masks.append(keypoint_mask(keypoints))
 
-                # Gambar landmark di visualisasi
+            # Gambar landmark di visualisasi
+            if draw:
                 for x, y in keypoints:
                     if x > 0 and y > 0:
                         cv2.circle(vis, (int(x), int(y)), 3, (0, 255, 0), -1)
                 cv2.putText(vis, f"P{pid+1}", (int(keypoints[0][0]), int(keypoints[0][1]) - 10),
                             cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 1)
 
-    return all_poses, vis
+    return all_poses, all_masks, vis
 
 
-def main():
-    print("=== Pose Preprocessing (YOLO11-Pose) ===")
-    files = [f for f in os.listdir(ICONIC_DIR) if f.lower().endswith((".jpg", ".png", ".jpeg"))]
+def extract_pose_from_image(image_path):
+    """Deteksi semua pose manusia pada gambar dan kembalikan (poses, masks, vis_image)."""
+    image = load_image(image_path)
+    if image is None:
+        print(f"[WARNING] Gagal membaca gambar: {image_path}")
+        return [], [], None
 
-    if not files:
-        print("[INFO] Tidak ada gambar di folder 'iconic_images/'.")
+    results = get_model()(image, verbose=False)
+    all_poses, all_masks, vis = [], [], image.copy()
+    for result in results:
+        poses, masks, vis = poses_from_result(result, vis)
+        all_poses.extend(poses)
+        all_masks.extend(masks)
+    return all_poses, all_masks, vis
+
+
+def _decoded_images(paths, workers, prefetch):
+    """Yield (path, image) berurutan; decode di process pool dengan paling banyak `prefetch` gambar di antrean."""
+    if workers == 0:
+        for path in paths:
+            yield path, load_image(path)
         return
 
-    for file in files:
-        path = os.path.join(ICONIC_DIR, file)
-        poses, vis = extract_pose_from_image(path)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for path in paths:
+            pending.append((path, pool.submit(load_image, path)))
+            if len(pending) >= prefetch:
+                path0, future = pending.pop(0)
+                yield path0, future.result()
+        for path0, future in pending:
+            yield path0, future.result()
 
-        if not poses:
-            print(f"[WARNING] Tidak ada pose terdeteksi di {file}")
+
+def extract_poses_batched(image_paths, batch_size=8, workers=None, draw=True):
+    """
+    Versi batch dari extract_pose_from_image untuk banyak gambar.
+
+    Decode + resize_and_pad berjalan paralel di process pool, deteksi dikirim
+    ke model.predict dalam batch berukuran tetap. Yield
+    (image_path, poses, masks, vis_image) sesuai urutan input.
+    """
+    model = get_model()
+    batch = []
+
+    def run(batch):
+        results = model.predict([image for _, image in batch], verbose=False)
+        for (path, image), result in zip(batch, results):
+            poses, masks, vis = poses_from_result(result, image, draw=draw)
+            yield path, poses, masks, vis
+
+    for path, image in _decoded_images(image_paths, workers, prefetch=2 * batch_size):
+        if image is None:
+            print(f"[WARNING] Gagal membaca gambar: {path}")
+            yield path, [], [], None
             continue
+        batch.append((path, image))
+        if len(batch) == batch_size:
+            yield from run(batch)
+            batch = []
+    if batch:
+        yield from run(batch)
+
+
+def file_hash(path):
+    """SHA-1 dari isi file (dibaca per blok supaya file besar tidak dimuat sekaligus)."""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
 
-        # Simpan semua pose ke JSON
-        for i, pose_data in enumerate(poses, start=1):
-            out_path = os.path.join(OUTPUT_DIR, f"{os.path.splitext(file)[0]}_person{i}.json")
+def build_key():
+    """Kunci cache global: model, parameter normalisasi dan ukuran resize."""
+    model_id = file_hash(MODEL_PATH) if os.path.exists(MODEL_PATH) else MODEL_PATH
+    return {
+        "model": model_id,
+        "normalization_version": NORMALIZATION_VERSION,
+        "target_size": list(TARGET_SIZE),
+    }
+
+
+def load_cache(cache_path=CACHE_PATH):
+    if not os.path.exists(cache_path):
+        return {"key": None, "images": {}}
+    try:
+        with open(cache_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[WARNING] Cache build rusak, rebuild penuh: {e}")
+        return {"key": None, "images": {}}
+
+
+def save_cache(cache, cache_path=CACHE_PATH):
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, cache_path)
+
+
+def remove_outputs(record):
+    """Hapus file JSON & visualisasi milik satu gambar (dipakai saat gambar dihapus/berubah)."""
+    for path in record.get("outputs", []):
+        if os.path.exists(path):
+            os.remove(path)
+            print(f"[DEL] {path}")
+
+
+def build_record(file, poses, masks, vis, write_json=False, vis_writer=None, preview=True):
+    """Tulis output satu gambar (JSON opsional + visualisasi) dan kembalikan record cache."""
+    record = {"entries": [], "outputs": []}
+
+    if not poses:
+        print(f"[WARNING] Tidak ada pose terdeteksi di {file}")
+        return record
+
+    for i, (pose_data, mask) in enumerate(zip(poses, masks), start=1):
+        name = f"{os.path.splitext(file)[0]}_person{i}"
+        record["entries"].append({"name": name, "pose": pose_data, "source_image": file,
+                                  "person": i, "mask": mask})
+
+        # (opsional) format lama: satu JSON per orang
+        if write_json:
+            out_path = os.path.join(OUTPUT_DIR, f"{name}.json")
             with open(out_path, "w") as f:
                 json.dump(pose_data, f, indent=2)
+            record["outputs"].append(out_path)
             print(f"[OK] Pose {i} disimpan: {out_path}")
 
-        # Simpan visualisasi ke file
-        if vis is not None:
-            vis_path = os.path.join(VISUAL_DIR, f"{os.path.splitext(file)[0]}_vis.jpg")
-            cv2.imwrite(vis_path, vis)
-            print(f"[IMG] Visualisasi disimpan: {vis_path}")
+    # Simpan visualisasi ke file (di thread terpisah, tidak menahan inferensi)
+    if vis is not None and vis_writer is not None:
+        vis_path = os.path.join(VISUAL_DIR, f"{os.path.splitext(file)[0]}_vis.jpg")
+        vis_writer.submit(cv2.imwrite, vis_path, vis)
+        record["outputs"].append(vis_path)
+        print(f"[IMG] Visualisasi disimpan: {vis_path}")
 
-        # (opsional) tampilkan sebentar
+    # (opsional) tampilkan sebentar, hanya kalau ada display
+    if vis is not None and preview:
         cv2.imshow("Pose Preview", vis)
         cv2.waitKey(500)
 
+    return record
+
+
+def main(write_json=False, store_path=DEFAULT_STORE_PATH, force=False, headless=False,
+         batch_size=8, workers=None, write_vis=True, index=None):
+    print("=== Pose Preprocessing (YOLO11-Pose) ===")
+    files = sorted(f for f in os.listdir(ICONIC_DIR) if f.lower().endswith((".jpg", ".png", ".jpeg")))
+
+    if not files:
+        # Tetap lanjut: output, library dan index dari gambar yang sudah dihapus harus dibersihkan
+        print("[INFO] Tidak ada gambar di folder 'iconic_images/'.")
+
+    cache = load_cache()
+    key = build_key()
+    if force or cache.get("key") != key:
+        if cache.get("images"):
+            print("[INFO] Model/normalisasi berubah, semua gambar diproses ulang.")
+        cached_images = {}
+    else:
+        cached_images = cache.get("images", {})
+
+    images = {}
+    todo = {}
+    for file in files:
+        digest = file_hash(os.path.join(ICONIC_DIR, file))
+        if file in cached_images and cached_images[file]["hash"] == digest \
+                and cached_images[file].get("json") == write_json:
+            images[file] = cached_images[file]
+        else:
+            todo[file] = digest
+
+    # Gambar baru atau berubah: buang output lama dulu (jumlah orang bisa berbeda)
+    for file in todo:
+        if file in cache.get("images", {}):
+            remove_outputs(cache["images"][file])
+
+    if todo:
+        preview = not headless
+        draw = preview or write_vis
+        vis_writer = ThreadPoolExecutor(max_workers=2) if write_vis else None
+        try:
+            paths = [os.path.join(ICONIC_DIR, f) for f in todo]
+            for path, poses, masks, vis in extract_poses_batched(paths, batch_size, workers, draw=draw):
+                file = os.path.basename(path)
+                record = build_record(file, poses, masks, vis, write_json, vis_writer, preview)
+                record["hash"] = todo[file]
+                record["json"] = write_json
+                images[file] = record
+        finally:
+            if vis_writer is not None:
+                vis_writer.shutdown(wait=True)
+        if preview:
+            cv2.destroyAllWindows()
+
+    # Gambar yang sudah dihapus dari iconic_images
+    removed = [f for f in cache.get("images", {}) if f not in images]
+    for file in removed:
+        print(f"[INFO] {file} dihapus, output lama dibuang.")
+        remove_outputs(cache["images"][file])
+
+    # Simpan semua pose ke satu library biner (array .npy + manifest)
+    entries = [entry for file in files for entry in images[file]["entries"]]
+    # Library lama ditulis ulang walau kosong, supaya matcher tidak memakai pose yang sudah dihapus
+    had_library = store_exists(store_path)
+    library_changed = (bool(entries) or had_library) and bool(todo or removed or not had_library)
+    if library_changed:
+        save_library(store_path, entries)
+        if not entries:
+            print("[WARNING] Tidak ada pose referensi tersisa, library sekarang kosong.")
+
+    # Index PCA + IVF untuk library besar (index=None: otomatis mulai INDEX_MIN_POSES pose)
+    build = index if index is not None else len(entries) >= INDEX_MIN_POSES
+    if entries and build and (library_changed or force or not os.path.exists(index_path(store_path))):
+        build_index(store_path)
+    elif library_changed and os.path.exists(index_path(store_path)):
+        os.remove(index_path(store_path))
+        print("[INFO] Pose index lama dihapus (library berubah, index tidak dibangun).")
+
+    save_cache({"key": key, "images": images})
+
+    print(f"[INFO] {len(todo)} gambar diproses, {len(files) - len(todo)} diambil dari cache.")
     print("=== Selesai! Semua pose referensi & visualisasi telah diekstrak. ===")
-    cv2.destroyAllWindows()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Extract reference poses from iconic images.")
+    parser.add_argument("--json", action="store_true",
+                        help="Tulis juga file JSON per orang (format lama) ke data/reference_poses")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH,
+                        help="Path library pose tanpa ekstensi (default: data/reference_library)")
+    parser.add_argument("--force", action="store_true",
+                        help="Abaikan cache dan proses ulang semua gambar")
+    parser.add_argument("--headless", action="store_true",
+                        help="Tanpa jendela preview (untuk server/CI tanpa display)")
+    parser.add_argument("--batch-size", type=int, default=8,
+                        help="Jumlah gambar per panggilan model.predict (default: 8)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Jumlah process untuk decode gambar (default: jumlah CPU, 0 = tanpa pool)")
+    parser.add_argument("--no-vis", action="store_true",
+                        help="Jangan tulis gambar visualisasi ke data/pose_visualizations")
+    parser.add_argument("--index", dest="index", action="store_true", default=None,
+                        help=f"Selalu bangun pose index (default: otomatis mulai {INDEX_MIN_POSES} pose)")
+    parser.add_argument("--no-index", dest="index", action="store_false",
+                        help="Jangan bangun pose index")
+    args = parser.parse_args()
+
+    main(write_json=args.json, store_path=args.store, force=args.force, headless=args.headless,
+         batch_size=args.batch_size, workers=args.workers, write_vis=not args.no_vis, index=args.index)
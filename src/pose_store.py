@@ -0,0 +1,207 @@
+import os
+import re
+import json
+import argparse
+import numpy as np
+
+# Naikkan versi ini kalau cara normalisasi di pose_preprocessing berubah,
+# supaya library lama tidak dicampur dengan pose baru.
+NORMALIZATION_VERSION = 2
+STORE_FORMAT_VERSION = 2
+NUM_KEYPOINTS = 17
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_STORE_PATH = os.path.join(BASE_DIR, "data", "reference_library")
+
+_PERSON_RE = re.compile(r"^(?P<base>.+)_person(?P<idx>\d+)$")
+
+
+def store_paths(store_path):
+    """Kembalikan (path .npy, path manifest .json) untuk sebuah store."""
+    base, ext = os.path.splitext(store_path)
+    if ext not in (".npy", ".json"):
+        base = store_path
+    return base + ".npy", base + ".json"
+
+
+def store_exists(store_path=DEFAULT_STORE_PATH):
+    array_path, manifest_path = store_paths(store_path)
+    return os.path.exists(array_path) and os.path.exists(manifest_path)
+
+
+def split_reference_name(name):
+    """'drake_21_person2' -> ('drake_21', 2). Index None kalau nama tidak berpola _personN."""
+    m = _PERSON_RE.match(name)
+    if m is None:
+        return name, None
+    return m.group("base"), int(m.group("idx"))
+
+
+def normalize_keypoints(xy, mask=None):
+    """
+    Representasi kanonik 17 keypoint COCO: kembalikan (pose (17, 2) float32, mask (17,) bool).
+
+    Indeks tetap sejajar dengan joint COCO. Titik yang tidak terlihat (mask
+    False, default: titik (0, 0)) dibuat nol; titik yang terlihat dipusatkan
+    ke rata-ratanya lalu seluruh pose dibuat unit norm.
+    """
+    xy = np.asarray(xy, dtype=np.float32).reshape(-1, 2)[:NUM_KEYPOINTS]
+    pose = np.zeros((NUM_KEYPOINTS, 2), dtype=np.float32)
+    pose[:len(xy)] = xy
+    if mask is None:
+        mask = ~np.all(pose == 0, axis=1)
+    else:
+        full = np.zeros(NUM_KEYPOINTS, dtype=bool)
+        full[:len(mask)] = np.asarray(mask, dtype=bool)[:NUM_KEYPOINTS]
+        mask = full
+
+    if not mask.any():
+        return np.zeros((NUM_KEYPOINTS, 2), dtype=np.float32), mask
+
+    pose -= pose[mask].mean(axis=0)
+    pose[~mask] = 0
+    norm = np.linalg.norm(pose)
+    if norm > 0:
+        pose /= norm
+    return pose, mask
+
+
+def normalize_batch(xy, mask):
+    """
+    Versi batch dari normalize_keypoints: xy (N, 17, 2) + mask (N, 17) -> (poses (N, 17, 2) float32, masks (N, 17) bool).
+
+    Hasilnya sama dengan memanggil normalize_keypoints per orang, tapi
+    seluruh batch dihitung dengan operasi NumPy tanpa loop Python.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    pose = np.where(mask[:, :, None], np.asarray(xy, dtype=np.float32), np.float32(0))
+    count = mask.sum(axis=1, keepdims=True)
+    mean = pose.sum(axis=1) / np.maximum(count, 1)
+    pose = np.where(mask[:, :, None], pose - mean[:, None, :], np.float32(0))
+    norm = np.sqrt((pose * pose).sum(axis=(1, 2)))
+    pose /= np.where(norm > 0, norm, 1)[:, None, None]
+    return pose.astype(np.float32, copy=False), mask
+
+
+def save_library(store_path, entries):
+    """
+    Tulis library pose ke satu array .npy (M, 17, 3) float32 + manifest .json.
+
+    Kolom terakhir array adalah visibilitas/mask tiap joint COCO (1 atau 0),
+    jadi satu mmap sudah berisi koordinat dan mask. Setiap entry adalah dict
+    dengan key: name, pose ((17, 2), sejajar indeks COCO) dan mask (17 bool),
+    serta opsional source_image dan person.
+    """
+    array_path, manifest_path = store_paths(store_path)
+    os.makedirs(os.path.dirname(array_path) or ".", exist_ok=True)
+
+    array = np.zeros((len(entries), NUM_KEYPOINTS, 3), dtype=np.float32)
+    for i, entry in enumerate(entries):
+        # Dinormalisasi ulang di sini supaya library selalu konsisten dengan
+        # NORMALIZATION_VERSION, apa pun sumber entry-nya.
+        pose, mask = normalize_keypoints(entry["pose"], entry.get("mask"))
+        array[i, :, :2] = pose
+        array[i, :, 2] = mask
+
+    manifest = {
+        "format_version": STORE_FORMAT_VERSION,
+        "normalization_version": NORMALIZATION_VERSION,
+        "num_points": NUM_KEYPOINTS,
+        "layout": "x,y,visible",
+        "normalized": True,
+        "entries": [],
+    }
+    for entry, row in zip(entries, array):
+        _, person = split_reference_name(entry["name"])
+        manifest["entries"].append({
+            "name": entry["name"],
+            "source_image": entry.get("source_image"),
+            "person": entry.get("person", person),
+            "visible": int(row[:, 2].sum()),
+        })
+
+    # Tulis ke file sementara lalu rename, supaya app yang sedang membaca
+    # tidak pernah melihat library setengah jadi.
+    tmp_array = array_path + ".tmp.npy"
+    tmp_manifest = manifest_path + ".tmp"
+    np.save(tmp_array, array)
+    with open(tmp_manifest, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_array, array_path)
+    os.replace(tmp_manifest, manifest_path)
+    print(f"[INFO] Reference library disimpan: {array_path} ({len(entries)} pose)")
+    return array_path, manifest_path
+
+
+def load_library(store_path=DEFAULT_STORE_PATH, mmap=True):
+    """Buka library: kembalikan (array (M, 17, 3) float32, manifest dict). Array di-mmap secara default."""
+    array_path, manifest_path = store_paths(store_path)
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+
+    if manifest.get("format_version") != STORE_FORMAT_VERSION:
+        raise RuntimeError(f"Format library {array_path} versi {manifest.get('format_version')} tidak didukung "
+                           f"(butuh {STORE_FORMAT_VERSION}). Jalankan ulang pose_store.py atau pose_preprocessing.")
+    if manifest.get("normalization_version") != NORMALIZATION_VERSION:
+        print(f"[WARNING] Library {array_path} memakai normalization_version "
+              f"{manifest.get('normalization_version')}, versi saat ini {NORMALIZATION_VERSION}. "
+              "Jalankan ulang pose_preprocessing.")
+
+    array = np.load(array_path, mmap_mode="r" if mmap else None)
+    if len(array) != len(manifest["entries"]):
+        raise RuntimeError(f"Library rusak: {len(array)} pose tapi {len(manifest['entries'])} entry di manifest")
+    return array, manifest
+
+
+def _find_source_image(image_dir, base):
+    if not image_dir or not os.path.isdir(image_dir):
+        return None
+    for f in sorted(os.listdir(image_dir)):
+        if os.path.splitext(f)[0] == base:
+            return f
+    return None
+
+
+def convert_json_dir(reference_dir, store_path=DEFAULT_STORE_PATH, image_dir=None):
+    """Konversi folder JSON lama (<image>_personN.json) menjadi satu library."""
+    entries = []
+    for file in sorted(os.listdir(reference_dir)):
+        if not file.endswith(".json"):
+            continue
+        with open(os.path.join(reference_dir, file), "r") as f:
+            pose = np.asarray(json.load(f), dtype=np.float32).reshape(-1, 2)
+
+        name = os.path.splitext(file)[0]
+        base, person = split_reference_name(name)
+        # File lama membuang titik kosong tanpa menyimpan indeksnya. Kalau ke-17
+        # titik masih lengkap, indeksnya sejajar COCO; kalau tidak, titik yang
+        # tersisa dianggap joint pertama (perilaku lama) dan diberi peringatan.
+        mask = np.arange(NUM_KEYPOINTS) < len(pose)
+        if len(pose) != NUM_KEYPOINTS:
+            print(f"[WARNING] {file}: hanya {len(pose)} titik, indeks joint tidak bisa dipulihkan. "
+                  "Jalankan ulang pose_preprocessing untuk hasil akurat.")
+        entries.append({
+            "name": name,
+            "pose": pose,
+            "source_image": _find_source_image(image_dir, base),
+            "person": person,
+            "mask": mask,
+        })
+
+    if not entries:
+        print(f"[WARNING] Tidak ada file JSON di {reference_dir}")
+        return None
+    return save_library(store_path, entries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert per-person JSON reference poses into a packed library.")
+    parser.add_argument("--reference-dir", default=os.path.join(BASE_DIR, "data", "reference_poses"),
+                        help="Folder berisi <image>_personN.json")
+    parser.add_argument("--image-dir", default=os.path.join(BASE_DIR, "data", "iconic_images"),
+                        help="Folder gambar ikonik (untuk mengisi source_image)")
+    parser.add_argument("--output", default=DEFAULT_STORE_PATH,
+                        help="Path library tanpa ekstensi (default: data/reference_library)")
+    args = parser.parse_args()
+
+    convert_json_dir(args.reference_dir, args.output, args.image_dir)
@@ -0,0 +1,110 @@
+import numpy as np
+
+
+class StreamingMatcher:
+    """
+    Pencocokan duo yang berjalan terus di setiap hasil inference, dengan skor yang dihaluskan.
+
+    Untuk tiap orang yang dilacak (track id) disimpan skor slot duo (D, 2)
+    yang dihaluskan secara eksponensial (EMA). Kedipan mata atau satu
+    deteksi buruk hanya menggeser skor sedikit, dan saat capture hasil
+    terbaik sudah tersedia (top()/best()) tanpa perhitungan tambahan.
+
+    track_ids sebaiknya berasal dari PoseTracker; tanpa itu urutan deteksi
+    dipakai sebagai id. Skor frame terakhir tiap track disimpan, jadi orang
+    yang posenya hampir tidak berubah (selisih joint < pose_tolerance) tidak
+    dicocokkan ulang.
+    """
+
+    def __init__(self, duo_matcher, alpha=0.3, max_missed=5, k=5, pose_tolerance=0.02):
+        self.duo_matcher = duo_matcher
+        self.alpha = alpha              # bobot skor frame terbaru
+        self.max_missed = max_missed    # update berturut-turut tanpa orang itu sebelum track dibuang
+        self.k = k
+        self.pose_tolerance = pose_tolerance
+        self.rematched = 0              # pose yang dicocokkan ulang
+        self.skipped = 0                # pose yang memakai skor cache
+        self.reset()
+
+    def reset(self):
+        """Buang semua track (mis. di awal sesi atau setelah capture)."""
+        self.tracks = {}                # track id -> skor EMA (D, 2)
+        self.missed = {}                # track id -> jumlah update terakhir tanpa deteksi
+        self.last = {}                  # track id -> (pose, mask, skor frame (D, 2)) terakhir
+        self.updates = 0
+        self._top = []
+
+    def _unchanged(self, track_id, pose, mask):
+        last = self.last.get(track_id)
+        return (last is not None and np.array_equal(last[1], mask)
+                and np.abs(last[0] - pose).max() < self.pose_tolerance)
+
+    def _frame_tensor(self, poses, masks):
+        """Skor (N, D, 2) frame ini untuk semua duo; duo di luar kandidat index diberi skor -1."""
+        duo_ids = self.duo_matcher.candidate_duos(poses, masks)
+        tensor = self.duo_matcher.score_tensor(poses, masks, duo_ids)
+        if duo_ids is None:
+            return tensor
+        full = np.full((len(tensor), len(self.duo_matcher.duos), 2), -1.0, dtype=np.float32)
+        full[:, duo_ids] = tensor
+        return full
+
+    def update(self, poses, masks=None, track_ids=None):
+        """
+        Tambahkan satu hasil inference: pose ternormalisasi (N, 17, 2) + mask (N, 17).
+
+        Kembalikan top-k terbaru (lihat top()).
+        """
+        self.updates += 1
+        track_ids = list(range(len(poses))) if track_ids is None else list(track_ids)
+
+        if len(poses) > 0:
+            poses = np.asarray(poses, dtype=np.float32)
+            masks = (~np.all(poses == 0, axis=2)) if masks is None else np.asarray(masks, dtype=bool)
+            frame_scores = [self.last[t][2] if self._unchanged(t, p, m) else None
+                            for t, p, m in zip(track_ids, poses, masks)]
+            changed = [i for i, scores in enumerate(frame_scores) if scores is None]
+            if changed:
+                tensor = self._frame_tensor(poses[changed], masks[changed])
+                # Slot yang tidak ada tetap -inf; EMA dihitung di atas nilai berhingga saja
+                tensor = np.where(np.isfinite(tensor), tensor, -1.0)
+                for i, scores in zip(changed, tensor):
+                    frame_scores[i] = scores
+                    self.last[track_ids[i]] = (poses[i], masks[i], scores)
+            self.rematched += len(changed)
+            self.skipped += len(poses) - len(changed)
+
+            for track_id, scores in zip(track_ids, frame_scores):
+                ema = self.tracks.get(track_id)
+                self.tracks[track_id] = scores if ema is None else ema + self.alpha * (scores - ema)
+                self.missed[track_id] = 0
+
+        for track_id in list(self.tracks):
+            if track_id in track_ids:
+                continue
+            self.missed[track_id] += 1
+            if self.missed[track_id] > self.max_missed:
+                del self.tracks[track_id]
+                del self.missed[track_id]
+                self.last.pop(track_id, None)
+
+        self._top = self._rank()
+        return self._top
+
+    def _rank(self):
+        if not self.tracks:
+            return []
+        ids = list(self.tracks)
+        tensor = np.stack([self.tracks[i] for i in ids])
+        tensor = np.where(self.duo_matcher.has_slot[None], tensor, -np.inf)
+        ranked = self.duo_matcher.rank(tensor, self.k)
+        return [(duo, score, tuple(None if p is None else ids[p] for p in assign))
+                for duo, score, assign in ranked]
+
+    def top(self, k=None):
+        """Top-k terakhir sebagai list (duo_name, score, (track_slot1, track_slot2))."""
+        return self._top[:k or self.k]
+
+    def best(self):
+        """Duo terbaik saat ini, atau None kalau belum ada orang yang terdeteksi."""
+        return self._top[0] if self._top else None
@@ -0,0 +1,126 @@
+import numpy as np
+
+try:
+    from .pose_batch import PoseBatch
+except ImportError:
+    from pose_batch import PoseBatch
+
+
+def keypoint_boxes(keypoints, conf_thresh=0.5):
+    """Bounding box (N, 4) x0, y0, x1, y1 of the visible keypoints of each person, plus the visibility mask (N, 17)."""
+    visible = keypoints[:, :, 2] > conf_thresh
+    xy = keypoints[:, :, :2]
+    big = np.float32(1e9)
+    x0 = np.where(visible, xy[:, :, 0], big).min(axis=1)
+    y0 = np.where(visible, xy[:, :, 1], big).min(axis=1)
+    x1 = np.where(visible, xy[:, :, 0], -big).max(axis=1)
+    y1 = np.where(visible, xy[:, :, 1], -big).max(axis=1)
+    boxes = np.stack([x0, y0, x1, y1], axis=1)
+    boxes[~visible.any(axis=1)] = 0
+    return boxes, visible
+
+
+def iou_matrix(a, b):
+    """IoU (N, T) between boxes a (N, 4) and b (T, 4)."""
+    ix0 = np.maximum(a[:, None, 0], b[None, :, 0])
+    iy0 = np.maximum(a[:, None, 1], b[None, :, 1])
+    ix1 = np.minimum(a[:, None, 2], b[None, :, 2])
+    iy1 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(ix1 - ix0, 0, None) * np.clip(iy1 - iy0, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+class PoseTracker:
+    """
+    Gives every detected person a stable ID across frames.
+
+    Detections are associated with existing tracks by a cost that mixes box
+    IoU and the mean distance between keypoints visible in both (relative to
+    the track's box size), using greedy lowest-cost-first assignment. That is
+    plenty for the handful of people at a booth, and it is all NumPy on
+    (N, T) matrices. Tracks that go unmatched for more than `max_age` updates
+    are dropped.
+    """
+
+    def __init__(self, iou_weight=1.0, keypoint_weight=1.0, max_cost=1.3, max_age=10, conf_thresh=0.5):
+        self.iou_weight = iou_weight
+        self.keypoint_weight = keypoint_weight
+        self.max_cost = max_cost
+        self.max_age = max_age
+        self.conf_thresh = conf_thresh
+        self.next_id = 1
+        self.tracks = {}  # id -> {"box", "keypoints", "visible", "age", "hits"}
+
+    def reset(self):
+        self.tracks = {}
+
+    def _costs(self, boxes, keypoints, visible, ids):
+        t_boxes = np.stack([self.tracks[i]["box"] for i in ids])
+        t_kps = np.stack([self.tracks[i]["keypoints"] for i in ids])
+        t_vis = np.stack([self.tracks[i]["visible"] for i in ids])
+
+        iou = iou_matrix(boxes, t_boxes)                                      # (N, T)
+        shared = visible[:, None, :] & t_vis[None, :, :]                      # (N, T, 17)
+        dist = np.linalg.norm(keypoints[:, None, :, :2] - t_kps[None, :, :, :2], axis=3)
+        scale = np.sqrt(np.maximum((t_boxes[:, 2] - t_boxes[:, 0]) * (t_boxes[:, 3] - t_boxes[:, 1]), 1.0))
+        n_shared = shared.sum(axis=2)
+        kp_dist = (dist * shared).sum(axis=2) / np.maximum(n_shared, 1) / scale[None, :]
+        kp_dist = np.where(n_shared > 0, np.minimum(kp_dist, 1.0), 1.0)
+        return self.iou_weight * (1 - iou) + self.keypoint_weight * kp_dist
+
+    def update(self, keypoints):
+        """Associate this frame's people (get_keypoints output) with tracks; return one track ID per person."""
+        kps = PoseBatch.from_keypoints(keypoints).data
+        boxes, visible = keypoint_boxes(kps, self.conf_thresh)
+
+        ids = list(self.tracks)
+        assigned = [None] * len(kps)
+        if ids and len(kps):
+            cost = self._costs(boxes, kps, visible, ids)
+            used = set()
+            for flat in np.argsort(cost, axis=None):
+                i, t = divmod(int(flat), len(ids))
+                if cost[i, t] > self.max_cost:
+                    break
+                if assigned[i] is None and t not in used:
+                    assigned[i] = ids[t]
+                    used.add(t)
+
+        for i, track_id in enumerate(assigned):
+            if track_id is None:
+                track_id = assigned[i] = self.next_id
+                self.next_id += 1
+                self.tracks[track_id] = {"hits": 0}
+            track = self.tracks[track_id]
+            track.update(box=boxes[i], keypoints=kps[i], visible=visible[i], age=0)
+            track["hits"] += 1
+
+        for track_id in ids:
+            if track_id not in assigned:
+                self.tracks[track_id]["age"] += 1
+                if self.tracks[track_id]["age"] > self.max_age:
+                    del self.tracks[track_id]
+        return assigned
+
+    def roi(self, frame_shape, margin=0.25, min_hits=2):
+        """
+        Region (x0, y0, x1, y1) around all confirmed, currently visible people, or None.
+
+        Used for ROI-cropped re-detection: a crop gives YOLO more pixels per
+        person. Run a full-frame detection now and then to pick up newcomers.
+        """
+        boxes = [t["box"] for t in self.tracks.values()
+                 if t["age"] == 0 and t["hits"] >= min_hits and t["visible"].any()]
+        if not boxes:
+            return None
+        boxes = np.stack(boxes)
+        x0, y0 = boxes[:, 0].min(), boxes[:, 1].min()
+        x1, y1 = boxes[:, 2].max(), boxes[:, 3].max()
+        mx, my = (x1 - x0) * margin, (y1 - y0) * margin
+        h, w = frame_shape[:2]
+        roi = (max(int(x0 - mx), 0), max(int(y0 - my), 0), min(int(x1 + mx), w), min(int(y1 + my), h))
+        if roi[2] - roi[0] < 32 or roi[3] - roi[1] < 32:
+            return None
+        return roi
@@ -1,6 +1,7 @@
-import cv2
-import time
-import numpy as np
+try:
+    from .frame_pool import constant_frame
+except ImportError:
+    from frame_pool import constant_frame
 
 class Transition:
     def __init__(self, ui):
@@ -16,26 +17,27 @@ class Transition:
                 break
 
             self.ui.overlay_text(frame, f"Capturing in... {seconds}", (200, 200))
-            cv2.imshow("TwinBros", frame)
 
             # Tunggu 1 detik sambil tetap update frame
-            key = cv2.waitKey(1000) & 0xFF
+            key = self.ui.show(frame, 1000) & 0xFF
             if key == ord('q'):
                 break
 
             seconds -= 1
 
-    def flash_effect(self, video_recorder=None):
+    def flash_effect(self, video_recorder=None, shape=(480, 640, 3)):
         """
         Simulasi efek flash kamera dengan overlay putih singkat pada window video.
+
+        shape: ukuran frame video stream (frame.shape), supaya frame flash
+        sama dengan frame lain di rekaman.
         """
-        flash_img = 255 * np.ones((480, 640, 3), dtype=np.uint8)  # Ukuran image harus sesuai video stream!
-        cv2.imshow("TwinBros", flash_img)
-        
+        flash_img = constant_frame(shape, 255)  # di-cache per ukuran, read-only
+
         if video_recorder:
             video_recorder.write(flash_img)
-            
-        cv2.waitKey(200)
+
+        self.ui.show(flash_img, 200)
         # Setelah efek, jangan destroy window agar stream tetap jalan!
         # cv2.destroyWindow("TwinBros")  # Jangan pakai ini!
 
@@ -1,10 +1,31 @@
 import cv2
-import numpy as np
+import time
 import os
 
+try:
+    from .frame_pool import text_frame
+except ImportError:
+    from frame_pool import text_frame
+
 class UI:
-    def __init__(self):
+    def __init__(self, headless=False, window="TwinBros"):
         self.font = cv2.FONT_HERSHEY_DUPLEX
+        # Headless: nothing is shown, waits become sleeps (file sources on a server)
+        self.headless = headless
+        self.window = window
+
+    def show(self, frame, wait_ms=1):
+        """Show a frame and wait up to wait_ms for a key; return the key code (-1 if none)."""
+        if self.headless:
+            time.sleep(wait_ms / 1000)
+            return -1
+        cv2.imshow(self.window, frame)
+        return cv2.waitKeyEx(wait_ms)
+
+    @staticmethod
+    def scaled_pos(shape, pos):
+        """Text position laid out for 640x480, moved to the same spot on a frame of this shape."""
+        return (pos[0] * shape[1] // 640, pos[1] * shape[0] // 480)
 
     def overlay_text(self, frame, text, pos=(20, 40), color=(255, 255, 255), scale=0.8):
         cv2.putText(frame, text, pos, self.font, scale, color, 2, cv2.LINE_AA)
@@ -15,26 +36,35 @@ class UI:
             mp_draw.draw_landmarks(frame, pose_landmarks, mp_pose.POSE_CONNECTIONS)
         return frame
 
-    def transition_message(self, msg="Get Ready!", duration=1000, video_recorder=None):
-        blank = np.zeros((480, 640, 3), dtype=np.uint8)
-        cv2.putText(blank, msg, (160, 240), self.font, 1.2, (255, 255, 255), 3, cv2.LINE_AA)
+    def transition_message(self, msg="Get Ready!", duration=1000, video_recorder=None, shape=(480, 640, 3)):
+        # Cached per message and frame shape (pass the stream's frame.shape), read-only
+        blank = text_frame(shape, [(msg, self.scaled_pos(shape, (160, 240)), 1.2, (255, 255, 255), 3)],
+                           font=self.font)
         
         start_time = cv2.getTickCount()
         while (cv2.getTickCount() - start_time) / cv2.getTickFrequency() * 1000 < duration:
-            cv2.imshow("TwinBros", blank)
             if video_recorder:
                 video_recorder.write(blank)
-            if cv2.waitKey(30) & 0xFF == ord('q'):
+            if self.show(blank, 30) & 0xFF == ord('q'):
                 break
 
-    def show_match_result(self, image_path, match_name, score, duration=2000, video_recorder=None):
-        if image_path and os.path.exists(image_path):
+    def show_match_result(self, image_path, match_name, score, duration=2000, video_recorder=None, image=None,
+                          shape=(480, 640, 3)):
+        # shape: the stream's frame.shape, so the result frames match the recording
+        size = (shape[1], shape[0])
+        if image is not None:
+            # Pre-decoded image (e.g. from IconicImageCache); copy before drawing on it
+            if image.shape[:2] != shape[:2]:
+                img = cv2.resize(image, size)
+            else:
+                img = image.copy()
+        elif image_path and os.path.exists(image_path):
             img = cv2.imread(image_path)
-            img = cv2.resize(img, (640, 480))
+            img = cv2.resize(img, size)
         else:
             # Fallback if image not found
-            img = np.zeros((480, 640, 3), dtype=np.uint8)
-            cv2.putText(img, "Image Not Found", (200, 240), self.font, 1, (0, 0, 255), 2)
+            img = text_frame(shape, [("Image Not Found", self.scaled_pos(shape, (200, 240)), 1, (0, 0, 255), 2)],
+                             font=self.font).copy()
 
         # Overlay text
         text = f"{match_name} ({score:.2f})"
@@ -42,8 +72,7 @@ class UI:
         
         start_time = cv2.getTickCount()
         while (cv2.getTickCount() - start_time) / cv2.getTickFrequency() * 1000 < duration:
-            cv2.imshow("TwinBros", img)
             if video_recorder:
                 video_recorder.write(img)
-            if cv2.waitKey(30) & 0xFF == ord('q'):
+            if self.show(img, 30) & 0xFF == ord('q'):
                 break
@@ -1,86 +1,255 @@
 import cv2
 import os
 import time
+import queue
+import shutil
+import threading
+import subprocess
+
+try:
+    from .frame_pool import FramePool
+except ImportError:
+    from frame_pool import FramePool
+
+# What write() does in async mode when the frame queue is full
+BLOCK = "block"              # wait for the encoder (no frames lost, may stall the caller)
+DROP_OLDEST = "drop_oldest"  # discard the oldest queued frame to make room
+DROP_NEWEST = "drop_newest"  # discard the frame being written
+
+# Audio formats that can go into an mp4 container without re-encoding
+_COPYABLE_AUDIO = (".mp3", ".m4a", ".aac")
+
+
+def find_ffmpeg():
+    """Path to an ffmpeg binary: system ffmpeg, else the one bundled with moviepy (imageio-ffmpeg)."""
+    path = shutil.which("ffmpeg")
+    if path:
+        return path
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return None
 
 class VideoRecorder:
-    def __init__(self, output_dir):
+    def __init__(self, output_dir, async_mode=False, queue_size=64, full_policy=BLOCK):
         self.output_dir = output_dir
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
         self.writer = None
         self.is_recording = False
 
+        # Async mode: frames go through a bounded queue to a dedicated encoder
+        # thread, so mp4v encoding is not paid on the render thread.
+        if full_policy not in (BLOCK, DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown full_policy: {full_policy}")
+        self.async_mode = async_mode
+        self.queue_size = queue_size
+        self.full_policy = full_policy
+        self.frames_encoded = 0
+        self.frames_dropped = 0
+        self._queue = None
+        self._thread = None
+        self._lock = threading.Lock()
+        # Queued copies reuse buffers the encoder has written (or that were dropped)
+        self._pool = FramePool(max_buffers=min(queue_size, 16))
+
     def start(self, width, height, fps=20.0):
-        timestamp = time.strftime("%Y%m%d-%H%M%S")
+        # A previous session may still be finalizing in the background
+        self.join()
+
         timestamp = time.strftime("%Y%m%d-%H%M%S")
         filename = f"session_{timestamp}.mp4"
         path = os.path.join(self.output_dir, filename)
-        
+
         # Define the codec and create VideoWriter object
         fourcc = cv2.VideoWriter_fourcc(*'mp4v')
         self.writer = cv2.VideoWriter(path, fourcc, fps, (width, height))
+        self.fps = fps
         self.is_recording = True
         self.current_video_path = path
+        self.frames_encoded = 0
+        self.frames_dropped = 0
+
+        if self.async_mode:
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            # Not a daemon: the process waits for the last frames to be written
+            self._thread = threading.Thread(target=self._encode_loop, args=(self.writer, self._queue),
+                                            name="VideoEncoder")
+            self._thread.start()
+
         print(f"[INFO] Recording started: {path}")
         return path
 
+    def _encode_loop(self, writer, frames):
+        while True:
+            item = frames.get()
+            if isinstance(item, tuple):
+                # Stop sentinel: ("stop", video_path, audio_path)
+                writer.release()
+                self._finalize(item[1], item[2])
+                return
+            writer.write(item)
+            self._pool.release(item)
+            with self._lock:
+                self.frames_encoded += 1
+
     def write(self, frame):
-        if self.is_recording and self.writer is not None:
+        if not self.is_recording or self.writer is None:
+            return
+
+        if not self.async_mode:
             self.writer.write(frame)
+            self.frames_encoded += 1
+            return
+
+        # Callers keep drawing on their frames, so queue a private copy
+        frame = self._pool.copy(frame)
+        if self.full_policy == BLOCK:
+            self._queue.put(frame)
+        elif self.full_policy == DROP_NEWEST:
+            try:
+                self._queue.put_nowait(frame)
+            except queue.Full:
+                self._pool.release(frame)
+                with self._lock:
+                    self.frames_dropped += 1
+        else:
+            while True:
+                try:
+                    self._queue.put_nowait(frame)
+                    break
+                except queue.Full:
+                    try:
+                        self._pool.release(self._queue.get_nowait())
+                        with self._lock:
+                            self.frames_dropped += 1
+                    except queue.Empty:
+                        pass
 
-    def stop(self, audio_path=None):
+    @property
+    def pending_frames(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def is_finalizing(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def join(self, timeout=None):
+        """Wait until queued frames are encoded and the file is finalized (async mode)."""
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if not self._thread.is_alive():
+                self._thread = None
+
+    def stop(self, audio_path=None, wait=True):
+        """
+        Stop recording and finalize the file (optionally merging audio).
+
+        In async mode with wait=False the remaining frames are drained and the
+        audio is merged on the encoder thread, so the caller returns at once;
+        use join() or is_finalizing to know when the file is complete.
+        """
         if self.is_recording:
-            self.writer.release()
-            self.writer = None
             self.is_recording = False
-            
             final_path = self.current_video_path
-            
-            # If audio path is provided, merge it
-            if audio_path and os.path.exists(audio_path):
-                print(f"[INFO] Merging audio: {audio_path}")
-                try:
-                    # Lazy import to avoid startup lag
-                    from moviepy import VideoFileClip, AudioFileClip
-                    
-                    video_clip = VideoFileClip(self.current_video_path)
-                    audio_clip = AudioFileClip(audio_path)
-                    
-                    # Loop audio if shorter, or trim if longer
-                    if audio_clip.duration < video_clip.duration:
-                        # Simple loop logic or just let it end? 
-                        # Usually music is longer. If shorter, let's strictly valid clip.
-                        pass 
-                    
-                    # Trim audio to match video duration
-                    audio_clip = audio_clip.subclipped(0, video_clip.duration)
-                    
-                    final_clip = video_clip.with_audio(audio_clip)
-                    
-                    # Rename original to temp
-                    base, ext = os.path.splitext(self.current_video_path)
-                    temp_path = f"{base}_temp{ext}"
-                    
-                    # Close the video clip reader so we can rename/delete
-                    # But VideoFileClip holds the file open.
-                    # Instead, write to a NEW file, then delete old.
-                    final_output_path = f"{base}_audio{ext}"
-                    
-                    final_clip.write_videofile(final_output_path, codec="libx264", audio_codec="aac", logger=None)
-                    
-                    # Close clips
-                    video_clip.close()
-                    audio_clip.close()
-                    
-                    # Cleanup: Remove original silent video, rename new one to original name?
-                    # Or keep 'session_..._audio.mp4' as the result?
-                    # Let's replace the original to keep filenames clean.
-                    os.remove(self.current_video_path)
-                    os.rename(final_output_path, self.current_video_path)
-                    
-                except Exception as e:
-                    print(f"[ERROR] Failed to merge audio: {e}")
-            
-            print(f"[INFO] Recording stopped: {final_path}")
+
+            if self.async_mode:
+                # Blocking put: the sentinel must never be dropped
+                self._queue.put(("stop", final_path, audio_path))
+                self.writer = None
+                if wait:
+                    self.join()
+                return final_path
+
+            self.writer.release()
+            self.writer = None
+            self._finalize(final_path, audio_path)
             return final_path
         return None
+
+    def _finalize(self, video_path, audio_path=None):
+        # If audio path is provided, merge it
+        if audio_path and os.path.exists(audio_path):
+            print(f"[INFO] Merging audio: {audio_path}")
+            duration = self.frames_encoded / self.fps if self.fps else None
+            if not self._mux_audio_ffmpeg(video_path, audio_path, duration):
+                self._mux_audio_moviepy(video_path, audio_path)
+
+        print(f"[INFO] Recording stopped: {video_path} "
+              f"({self.frames_encoded} frames encoded, {self.frames_dropped} dropped)")
+
+    def _mux_audio_ffmpeg(self, video_path, audio_path, duration=None):
+        """
+        Fast path: copy the video stream as-is and only trim (copy or AAC-encode)
+        the audio. Cost depends on the audio segment, not on session length.
+        Returns False if ffmpeg is unavailable or fails.
+        """
+        ffmpeg = find_ffmpeg()
+        if ffmpeg is None:
+            return False
+
+        base, ext = os.path.splitext(video_path)
+        final_output_path = f"{base}_audio{ext}"
+        audio_codec = "copy" if os.path.splitext(audio_path)[1].lower() in _COPYABLE_AUDIO else "aac"
+
+        cmd = [ffmpeg, "-y", "-v", "error", "-i", video_path]
+        if duration:
+            cmd += ["-t", f"{duration:.3f}"]
+        cmd += ["-i", audio_path,
+                "-map", "0:v:0", "-map", "1:a:0",
+                "-c:v", "copy", "-c:a", audio_codec,
+                "-shortest", "-movflags", "+faststart", final_output_path]
+        try:
+            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=60)
+        except (OSError, subprocess.SubprocessError) as e:
+            stderr = getattr(e, "stderr", None)
+            detail = stderr.decode(errors="replace").strip() if stderr else e
+            print(f"[WARNING] ffmpeg mux failed, falling back to moviepy: {detail}")
+            if os.path.exists(final_output_path):
+                os.remove(final_output_path)
+            return False
+
+        os.replace(final_output_path, video_path)
+        return True
+
+    def _mux_audio_moviepy(self, video_path, audio_path):
+        """Fallback: full decode and libx264 re-encode through moviepy."""
+        try:
+            # Lazy import to avoid startup lag
+            from moviepy import VideoFileClip, AudioFileClip
+
+            video_clip = VideoFileClip(video_path)
+            audio_clip = AudioFileClip(audio_path)
+
+            # Loop audio if shorter, or trim if longer
+            if audio_clip.duration < video_clip.duration:
+                # Simple loop logic or just let it end?
+                # Usually music is longer. If shorter, let's strictly valid clip.
+                pass
+
+            # Trim audio to match video duration
+            audio_clip = audio_clip.subclipped(0, video_clip.duration)
+
+            final_clip = video_clip.with_audio(audio_clip)
+
+            # Close the video clip reader so we can rename/delete
+            # But VideoFileClip holds the file open.
+            # Instead, write to a NEW file, then delete old.
+            base, ext = os.path.splitext(video_path)
+            final_output_path = f"{base}_audio{ext}"
+
+            final_clip.write_videofile(final_output_path, codec="libx264", audio_codec="aac", logger=None)
+
+            # Close clips
+            video_clip.close()
+            audio_clip.close()
+
+            # Cleanup: Remove original silent video, rename new one to original name?
+            # Or keep 'session_..._audio.mp4' as the result?
+            # Let's replace the original to keep filenames clean.
+            os.remove(video_path)
+            os.rename(final_output_path, video_path)
+
+        except Exception as e:
+            print(f"[ERROR] Failed to merge audio: {e}")